@@ -1,7 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
-from celery.signals import worker_ready
+from celery.signals import worker_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chesshub_project.settings')
 
@@ -15,11 +15,28 @@ app.conf.update(
 )
 
 app.conf.beat_schedule = {
-    'refresh_fen_cache_every_six_hours': {
-        'task': 'main.tasks.refresh_fen_cache',
-        'schedule': 10,  
+    'sync_position_index': {
+        'task': 'main.tasks.sync_fen_to_redis',
+        'schedule': int(os.getenv('POSITION_INDEX_SYNC_INTERVAL', 60)),
+    },
+    'annotate_positions': {
+        'task': 'main.tasks.annotate_positions',
+        'schedule': int(os.getenv('ANNOTATE_INTERVAL', 300)),
+    },
+    # Ponovno prolazi pgn_uploads, da datoteke s izgubljenim chunkovima prođu provjeru zastoja
+    'recover_pgn_uploads': {
+        'task': 'main.tasks.fetch_pgn_files_from_storage',
+        'schedule': int(os.getenv('PGN_RECOVERY_INTERVAL', 900)),
     },
 }
 app.conf.timezone = 'UTC'
 
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+
+@worker_init.connect
+def preload_chess_model(**kwargs):
+    # Evaluacijski worker učitava model jednom, prije nego što počne primati zadatke
+    if os.getenv('EVAL_PRELOAD_MODEL') == 'True':
+        from main.chess_model.evaluation import get_backend
+        get_backend()
\ No newline at end of file
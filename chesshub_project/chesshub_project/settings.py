@@ -177,9 +177,76 @@ CELERY_TASK_ROUTES = {
     'main.tasks.process_pgn_queue': {'queue': 'process_queue'},
     'main.tasks.upload_pgn_to_storage': {'queue': 'upload_queue'},
     'main.tasks.fetch_pgn_files_from_storage': {'queue': 'fetch_queue'},
-    'main.tasks.refresh_fen_cache': {'queue': 'beat_queue'},
+    'main.tasks.sync_fen_to_redis': {'queue': 'beat_queue'},
+    'main.tasks.rebuild_position_index': {'queue': 'beat_queue'},
+    'main.tasks.warm_position_index': {'queue': 'beat_queue'},
+    'main.tasks.evaluate_position_task': {'queue': 'eval_queue'},
+    'main.tasks.analyse_game': {'queue': 'eval_queue'},
+    'main.tasks.annotate_positions': {'queue': 'eval_queue'},
 }
 
+# Chunkovi za process_pgn_chunk zatvaraju se na koju god granicu prvu dosegnu
+PGN_CHUNK_TARGET_BYTES = int(os.getenv('PGN_CHUNK_TARGET_BYTES', 1024 * 1024))
+PGN_CHUNK_MAX_GAMES = int(os.getenv('PGN_CHUNK_MAX_GAMES', 1000))
+PGN_DISPATCH_LOCK_TIMEOUT = int(os.getenv('PGN_DISPATCH_LOCK_TIMEOUT', 600))
+# Ako nijedan chunk datoteke ne završi ovoliko sekundi, nedovršeni chunkovi se šalju ponovno
+PGN_CHUNK_STALE_TIMEOUT = int(os.getenv('PGN_CHUNK_STALE_TIMEOUT', 3600))
+
+# 'orm' (bulk_create) ili 'copy' (PostgreSQL COPY, main.bulk_loader.CopyLoader)
+PGN_BULK_LOADER = os.getenv('PGN_BULK_LOADER', 'orm')
+# Najviše (pozicija, potez) agregata koje bulk import drži u memoriji prije upserta
+BULK_STATS_FLUSH_ROWS = int(os.getenv('BULK_STATS_FLUSH_ROWS', 1000000))
+
+# Redis indeks pozicija (pos:<hash> -> id-evi partija), trajan i održavan inkrementalno (sync_fen_to_redis)
+POSITION_INDEX_SYNC_BATCH = int(os.getenv('POSITION_INDEX_SYNC_BATCH', 20000))
+POSITION_INDEX_LOCK_TIMEOUT = int(os.getenv('POSITION_INDEX_LOCK_TIMEOUT', 300))
+POSITION_NEGATIVE_TTL = int(os.getenv('POSITION_NEGATIVE_TTL', 300))
+
+# Gornja granica za COUNT pri listanju partija; iznad nje broj stranica je procjena
+GAME_LIST_COUNT_CAP = int(os.getenv('GAME_LIST_COUNT_CAP', 10000))
+# Koliko dugo se drži procjena ukupnog broja partija (sekunde)
+GAME_COUNT_CACHE_TIMEOUT = int(os.getenv('GAME_COUNT_CACHE_TIMEOUT', 60))
+
+# Keš lista partija: ključevi nose generaciju koju unos partija povećava
+GAME_LIST_CACHE_TIMEOUT = int(os.getenv('GAME_LIST_CACHE_TIMEOUT', 1200))
+GAME_LIST_LOCK_TIMEOUT = int(os.getenv('GAME_LIST_LOCK_TIMEOUT', 30))
+GAME_LIST_LOCK_WAIT = float(os.getenv('GAME_LIST_LOCK_WAIT', 2))
+
+# Stablo analize po sesiji: lokalni LRU u procesu + Redis
+ANALYSIS_TREE_LRU_SIZE = int(os.getenv('ANALYSIS_TREE_LRU_SIZE', 1000))
+ANALYSIS_TREE_TTL = int(os.getenv('ANALYSIS_TREE_TTL', 60 * 60 * 24))
+
+# Servis za evaluaciju: najviše EVAL_MAX_BATCH pozicija po prolazu, čeka se najviše EVAL_MAX_WAIT_MS od prvog zahtjeva
+EVAL_MAX_BATCH = int(os.getenv('EVAL_MAX_BATCH', 32))
+EVAL_MAX_WAIT_MS = float(os.getenv('EVAL_MAX_WAIT_MS', 5))
+EVAL_TIMEOUT = float(os.getenv('EVAL_TIMEOUT', 30))
+# local = model u web procesu; celery = evaluacija u eval_queue workeru (web ne učitava torch)
+EVAL_MODE = os.getenv('EVAL_MODE', 'local')
+
+# Backend modela: torch, torchscript, onnx ili onnx-int8 (vidi manage.py export_chess_model)
+CHESS_MODEL_BACKEND = os.getenv('CHESS_MODEL_BACKEND', 'torch')
+# 0 = onnxruntime sam bira broj dretvi
+ONNX_INTRA_OP_THREADS = int(os.getenv('ONNX_INTRA_OP_THREADS', 0))
+
+# Keš evaluacija: lokalni LRU u procesu ispred Redisa; ključ uključuje verziju modela (prazno = veličina i mtime checkpointa)
+CHESS_MODEL_VERSION = os.getenv('CHESS_MODEL_VERSION', '')
+EVAL_CACHE_LOCAL_SIZE = int(os.getenv('EVAL_CACHE_LOCAL_SIZE', 10000))
+EVAL_CACHE_TIMEOUT = int(os.getenv('EVAL_CACHE_TIMEOUT', 60 * 60 * 24 * 7))
+EVAL_CACHE_STATS_FLUSH = int(os.getenv('EVAL_CACHE_STATS_FLUSH', 100))
+
+# Analiza cijele partije: broj pozicija po jednom prolazu kroz model
+ANALYSIS_BATCH_SIZE = int(os.getenv('ANALYSIS_BATCH_SIZE', 256))
+# Analiza koja je toliko sekundi u stanju pending/running smatra se izgubljenom i šalje se ponovno
+ANALYSIS_STALE_AFTER = int(os.getenv('ANALYSIS_STALE_AFTER', 600))
+
+# Evaluacija svih pozicija u pozadini: najviše ANNOTATE_MAX_POSITIONS_PER_SEC (0 = bez ograničenja), ANNOTATE_MAX_SECONDS po pokretanju
+ANNOTATE_BATCH_SIZE = int(os.getenv('ANNOTATE_BATCH_SIZE', 512))
+ANNOTATE_MAX_POSITIONS_PER_SEC = float(os.getenv('ANNOTATE_MAX_POSITIONS_PER_SEC', 500))
+ANNOTATE_MAX_SECONDS = int(os.getenv('ANNOTATE_MAX_SECONDS', 240))
+ANNOTATE_LOCK_TIMEOUT = int(os.getenv('ANNOTATE_LOCK_TIMEOUT', 300))
+# Pauza čim redovi za unos partija imaju više poruka od ovoga (0 = radi samo kad su prazni)
+ANNOTATE_BACKLOG_LIMIT = int(os.getenv('ANNOTATE_BACKLOG_LIMIT', 0))
+
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/login/'
@@ -202,10 +269,11 @@ CACHES = {
     }
 }
 
-SESSION_ENGINE = 'django.contrib.sessions.backends.db' 
+# cached_db: čitanja idu iz Redisa, a baza se piše samo kad se sesija stvarno promijeni
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
 
 SESSION_COOKIE_AGE = 86400  
-SESSION_SAVE_EVERY_REQUEST = True 
+SESSION_SAVE_EVERY_REQUEST = os.getenv('SESSION_SAVE_EVERY_REQUEST', 'False') == 'True'
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 
 TIME_ZONE = 'UTC'
@@ -5,5 +5,5 @@ from .models import PGNFile, Game, FENPosition
 admin.site.register(Game)
 @admin.register(FENPosition)
 class FENPositionAdmin(admin.ModelAdmin):
-    list_display = ('fen_string', 'game', 'move_number', 'created_at')
+    list_display = ('position_hash', 'fen_string', 'game', 'move_number', 'created_at')
 admin.site.register
\ No newline at end of file
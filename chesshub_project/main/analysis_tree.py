@@ -0,0 +1,232 @@
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+
+import chess
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisTree:
+    """
+    Move tree of the analysis board stored as flat per-node arrays.
+
+    Node 0 is the starting position. ``children[n][0]`` is the main line after
+    node ``n``. ``current`` points at the node shown on the board, so moving
+    and navigating never walk the tree from the root. ``token`` identifies
+    the tree across processes; ``version`` only counts changes within it.
+    """
+
+    def __init__(self):
+        self.parent = [None]
+        self.uci = [None]
+        self.san = [None]
+        self.fen = [chess.STARTING_FEN]
+        self.ply = [0]
+        self.children = [[]]
+        self.current = 0
+        self.token = uuid.uuid4().hex
+        self.version = 0
+        self._movetext = None
+
+    def to_dict(self):
+        return {
+            'parent': self.parent,
+            'uci': self.uci,
+            'san': self.san,
+            'fen': self.fen,
+            'ply': self.ply,
+            'children': self.children,
+            'token': self.token,
+            'version': self.version,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        tree = cls()
+        tree.parent = data['parent']
+        tree.uci = data['uci']
+        tree.san = data['san']
+        tree.fen = data['fen']
+        tree.ply = data['ply']
+        tree.children = data['children']
+        tree.token = data['token']
+        tree.version = data['version']
+        return tree
+
+    def changed(self):
+        self.version += 1
+        self._movetext = None
+
+    def add_move(self, move_san):
+        # Vraća (čvor, je li stablo promijenjeno); ValueError za neispravan ili nelegalan potez
+        board = chess.Board(self.fen[self.current])
+        move = board.parse_san(move_san)
+        uci = move.uci()
+
+        for child in self.children[self.current]:
+            if self.uci[child] == uci:
+                self.current = child
+                return child, False
+
+        san = board.san(move)
+        board.push(move)
+
+        node = len(self.parent)
+        self.parent.append(self.current)
+        self.uci.append(uci)
+        self.san.append(san)
+        self.fen.append(board.fen())
+        self.ply.append(self.ply[self.current] + 1)
+        self.children.append([])
+
+        siblings = self.children[self.current]
+        siblings.append(node)
+        if len(siblings) > 1:
+            self.promote(node)
+
+        self.current = node
+        self.changed()
+        return node, True
+
+    def promote(self, node):
+        # Kao chess.pgn promote: varijanta ide jedno mjesto naviše
+        siblings = self.children[self.parent[node]]
+        index = siblings.index(node)
+        if index > 0:
+            siblings[index - 1], siblings[index] = siblings[index], siblings[index - 1]
+            self.changed()
+
+    def back(self):
+        if self.current == 0:
+            return None
+        self.current = self.parent[self.current]
+        return self.current
+
+    def forward(self, variation_index=0):
+        children = self.children[self.current]
+        if not 0 <= variation_index < len(children):
+            return None
+        self.current = children[variation_index]
+        return self.current
+
+    def delta(self, node=None):
+        node = self.current if node is None else node
+        return {
+            'node': node,
+            'parent': self.parent[node],
+            'uci': self.uci[node],
+            'san': self.san[node],
+            'ply': self.ply[node],
+            'fen': self.fen[node],
+            'next_moves': [self.uci[child] for child in self.children[node]],
+        }
+
+    def _move_token(self, node, force_number):
+        ply = self.ply[node]
+        number = (ply + 1) // 2
+        if ply % 2:
+            return f"{number}. {self.san[node]}"
+        if force_number:
+            return f"{number}... {self.san[node]}"
+        return self.san[node]
+
+    def _line(self, node, first_child, force_number):
+        tokens = []
+        child = first_child
+        while child is not None:
+            tokens.append(self._move_token(child, force_number))
+            force_number = False
+
+            alternatives = self.children[node][1:] if child == self.children[node][0] else []
+            for alternative in alternatives:
+                tokens.append(f"( {self._line(node, alternative, True)} )")
+                force_number = True
+
+            node = child
+            child = self.children[node][0] if self.children[node] else None
+        return ' '.join(tokens)
+
+    def movetext(self):
+        # Tekst poteza bez zaglavlja, u istom obliku kao str(game) bez zaglavlja; računa se samo nakon promjene stabla
+        if self._movetext is None:
+            line = self._line(0, self.children[0][0], True) if self.children[0] else ''
+            self._movetext = f"{line} *".strip()
+        return self._movetext
+
+
+_local_trees = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def tree_key(session_key):
+    return f"analysis_tree:{session_key}"
+
+
+def pointer_key(session_key):
+    return f"analysis_tree:{session_key}:current"
+
+
+def _session_key(request):
+    if request.session.session_key is None:
+        request.session.save()
+    return request.session.session_key
+
+
+def _remember(session_key, tree):
+    with _local_lock:
+        _local_trees[session_key] = tree
+        _local_trees.move_to_end(session_key)
+        while len(_local_trees) > settings.ANALYSIS_TREE_LRU_SIZE:
+            _local_trees.popitem(last=False)
+
+
+def load_tree(request):
+    """
+    Returns the session's analysis tree.
+
+    The small pointer key ``(token, version, current)`` is always read from
+    the cache; the node arrays are only fetched when the in-process copy is
+    missing, belongs to another tree or is older than that version.
+    """
+    session_key = _session_key(request)
+    pointer = cache.get(pointer_key(session_key))
+    if pointer is None or len(pointer) != 3:
+        return AnalysisTree()
+
+    token, version, current = pointer
+    with _local_lock:
+        tree = _local_trees.get(session_key)
+
+    if tree is None or tree.token != token or tree.version != version:
+        data = cache.get(tree_key(session_key))
+        if data is None or data.get('token') != token or data['version'] != version:
+            logger.warning(f"Analysis tree for session {session_key} is missing, starting a new one.")
+            return AnalysisTree()
+        tree = AnalysisTree.from_dict(data)
+
+    tree.current = current
+    _remember(session_key, tree)
+    return tree
+
+
+def save_tree(request, tree, structure_changed=False):
+    # Navigacija mijenja samo pokazivač; čvorovi se zapisuju samo kad se stablo promijeni
+    session_key = _session_key(request)
+    timeout = settings.ANALYSIS_TREE_TTL
+    if structure_changed:
+        cache.set(tree_key(session_key), tree.to_dict(), timeout=timeout)
+    else:
+        cache.touch(tree_key(session_key), timeout=timeout)
+    cache.set(pointer_key(session_key), (tree.token, tree.version, tree.current), timeout=timeout)
+    _remember(session_key, tree)
+
+
+def clear_tree(request):
+    session_key = _session_key(request)
+    cache.delete_many([tree_key(session_key), pointer_key(session_key)])
+    with _local_lock:
+        _local_trees.pop(session_key, None)
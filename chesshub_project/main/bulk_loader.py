@@ -0,0 +1,345 @@
+import io
+import logging
+import time
+
+from psycopg2.extras import execute_values
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Game, GameFacetCount, Position, PositionOccurrence, PositionMoveStats
+from .pgn_utils import normalize_fen
+from .game_queries import facet_values
+from .game_cache import bump_generation
+
+logger = logging.getLogger(__name__)
+
+# Indeks stupca u retku agregata po rezultatu partije
+RESULT_COLUMNS = {'1-0': 1, '1/2-1/2': 2, '0-1': 3}
+
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+def copy_rows(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    # Imena se navode u navodnicima jer PostgreSQL inače spušta velika slova (white_FideId)
+    quoted_columns = ', '.join(f'"{column}"' for column in columns)
+    cursor.copy_expert(f'COPY "{table}" ({quoted_columns}) FROM STDIN', buffer)
+
+
+def unique_positions(parsed_games):
+    # Sortirano po ključu da paralelni chunkovi zaključavaju redove istim redoslijedom
+    positions = {}
+    for _, game_positions in parsed_games:
+        for position_hash, fen, _ in game_positions:
+            if position_hash not in positions:
+                positions[position_hash] = normalize_fen(fen)
+    return sorted(positions.items())
+
+
+def add_move_stats(stats, parsed_games):
+    # Pribraja u postojeći rječnik (position_hash, move) -> agregat, da se može skupljati kroz više batcheva
+    for game, positions in parsed_games:
+        result_index = RESULT_COLUMNS.get(game.result)
+        rated = bool(game.white_elo and game.black_elo)
+        average_elo = (game.white_elo + game.black_elo) // 2 if rated else 0
+
+        # Partija koja se vrati u istu poziciju i odigra isti potez broji se jednom
+        for position_hash, move in {(position_hash, move) for position_hash, _, move in positions if move is not None}:
+            row = stats.get((position_hash, move))
+            if row is None:
+                row = stats[(position_hash, move)] = [0, 0, 0, 0, 0, 0, None]
+            row[0] += 1
+            if result_index is not None:
+                row[result_index] += 1
+            row[4] += average_elo
+            row[5] += rated
+            if game.date and (row[6] is None or game.date > row[6]):
+                row[6] = game.date
+    return stats
+
+
+def move_stats(parsed_games):
+    return move_stats_rows(add_move_stats({}, parsed_games))
+
+
+def move_stats_rows(stats):
+    return [(position_hash, move, *row) for (position_hash, move), row in sorted(stats.items())]
+
+
+def upsert_move_stats(cursor, rows):
+    # Agregat se samo uvećava; redovi su sortirani po ključu da se paralelni chunkovi ne zaključaju međusobno
+    if not rows:
+        return
+
+    if connection.vendor != 'postgresql':
+        for position_hash, move, games, white_wins, draws, black_wins, elo_sum, elo_games, last_played in rows:
+            stats, _ = PositionMoveStats.objects.get_or_create(position_id=position_hash, move=move)
+            stats.games += games
+            stats.white_wins += white_wins
+            stats.draws += draws
+            stats.black_wins += black_wins
+            stats.elo_sum += elo_sum
+            stats.elo_games += elo_games
+            if last_played and (stats.last_played is None or last_played > stats.last_played):
+                stats.last_played = last_played
+            stats.save()
+        return
+
+    # COPY u staging tablicu pa jedan INSERT ... SELECT; execute_values je na velikim agregatima višestruko sporiji
+    table = PositionMoveStats._meta.db_table
+    columns = ['position_id', 'move', 'games', 'white_wins', 'draws', 'black_wins', 'elo_sum', 'elo_games', 'last_played']
+    cursor.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS move_stats_staging (position_id bigint, move varchar(5), games integer, "
+        "white_wins integer, draws integer, black_wins integer, elo_sum bigint, elo_games integer, last_played date) "
+        "ON COMMIT DELETE ROWS"
+    )
+    cursor.execute("TRUNCATE move_stats_staging")
+    copy_rows(cursor, 'move_stats_staging', columns, rows)
+    cursor.execute(f"""
+        INSERT INTO "{table}" AS s ({', '.join(columns)})
+        SELECT {', '.join(columns)} FROM move_stats_staging ORDER BY position_id, move
+        ON CONFLICT (position_id, move) DO UPDATE SET
+            games = s.games + EXCLUDED.games,
+            white_wins = s.white_wins + EXCLUDED.white_wins,
+            draws = s.draws + EXCLUDED.draws,
+            black_wins = s.black_wins + EXCLUDED.black_wins,
+            elo_sum = s.elo_sum + EXCLUDED.elo_sum,
+            elo_games = s.elo_games + EXCLUDED.elo_games,
+            last_played = GREATEST(s.last_played, EXCLUDED.last_played)
+    """)
+
+
+def add_facet_counts(counts, parsed_games):
+    for game, _ in parsed_games:
+        for key in facet_values(game.result, game.eco, game.white_elo, game.black_elo, game.date):
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def facet_counts(parsed_games):
+    return facet_counts_rows(add_facet_counts({}, parsed_games))
+
+
+def facet_counts_rows(counts):
+    return [(facet, value, games) for (facet, value), games in sorted(counts.items())]
+
+
+def upsert_facet_counts(cursor, rows):
+    if not rows:
+        return
+
+    if connection.vendor != 'postgresql':
+        for facet, value, games in rows:
+            counts, _ = GameFacetCount.objects.get_or_create(facet=facet, value=value)
+            counts.games += games
+            counts.save()
+        return
+
+    table = GameFacetCount._meta.db_table
+    execute_values(cursor.cursor, f"""
+        INSERT INTO "{table}" AS s (facet, value, games)
+        VALUES %s
+        ON CONFLICT (facet, value) DO UPDATE SET games = s.games + EXCLUDED.games
+    """, rows)
+
+
+class OrmLoader:
+    """
+    Writes parsed games through the ORM, one transaction per ``write()``.
+
+    With ``defer_stats`` the opening explorer and facet aggregates are summed
+    in memory across batches and upserted by ``finish()`` (or earlier, once
+    ``BULK_STATS_FLUSH_ROWS`` distinct moves have piled up), so bulk imports
+    don't rewrite the same popular rows once per batch. Celery chunks keep the
+    per-write upsert because nothing calls ``finish()`` across chunks.
+    """
+
+    def __init__(self, batch_size=500, defer_stats=False):
+        self.batch_size = batch_size
+        self.defer_stats = defer_stats
+        self.pending_move_stats = {}
+        self.pending_facet_counts = {}
+        self.games_written = 0
+        self.rows_written = 0
+        self.started = time.perf_counter()
+
+    def write(self, parsed_games):
+        # bulk_create na PostgreSQL-u postavlja id na iste instance, pa se pozicije vežu uz partiju u jednom prolazu
+        with transaction.atomic():
+            Game.objects.bulk_create([game for game, _ in parsed_games], batch_size=self.batch_size)
+
+            Position.objects.bulk_create(
+                [Position(id=position_hash, fen=fen) for position_hash, fen in unique_positions(parsed_games)],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+
+            occurrences = [
+                PositionOccurrence(position_id=position_hash, game_id=game.id, ply=ply)
+                for game, positions in parsed_games
+                for ply, (position_hash, _, _) in enumerate(positions)
+            ]
+            PositionOccurrence.objects.bulk_create(occurrences, batch_size=self.batch_size)
+
+            with connection.cursor() as cursor:
+                self.write_stats(cursor, parsed_games)
+
+        self.games_written += len(parsed_games)
+        self.rows_written += len(parsed_games) + len(occurrences)
+        self.flush_stats_if_full()
+        # Svaki put unosa (Celery chunkovi, import_pgn, skripte) ide kroz loader, pa se cache lista poništava ovdje
+        bump_generation()
+        return len(occurrences)
+
+    def write_stats(self, cursor, parsed_games):
+        if self.defer_stats:
+            add_move_stats(self.pending_move_stats, parsed_games)
+            add_facet_counts(self.pending_facet_counts, parsed_games)
+            return
+        upsert_move_stats(cursor, move_stats(parsed_games))
+        upsert_facet_counts(cursor, facet_counts(parsed_games))
+
+    def flush_stats_if_full(self):
+        # Ograničava memoriju na velikim arhivama; duplikati se i dalje spajaju unutar jednog flusha
+        if len(self.pending_move_stats) >= settings.BULK_STATS_FLUSH_ROWS:
+            self.flush_stats()
+
+    def flush_stats(self):
+        if not self.pending_move_stats and not self.pending_facet_counts:
+            return
+        with transaction.atomic(), connection.cursor() as cursor:
+            upsert_move_stats(cursor, move_stats_rows(self.pending_move_stats))
+            upsert_facet_counts(cursor, facet_counts_rows(self.pending_facet_counts))
+        self.pending_move_stats = {}
+        self.pending_facet_counts = {}
+
+    def finish(self):
+        self.flush_stats()
+        bump_generation()
+
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return self.rows_written / elapsed if elapsed else 0.0
+
+
+class CopyLoader(OrmLoader):
+    """
+    Streams games and position occurrences into PostgreSQL with COPY.
+
+    Game ids are reserved from the table's sequence up front so occurrences can
+    reference them without a round trip per game. New positions go through a
+    temporary staging table and ``INSERT ... ON CONFLICT DO NOTHING``. With
+    ``defer_indexes`` the secondary indexes of the game and occurrence tables
+    are dropped on the first write and rebuilt by ``finish()``.
+    """
+
+    def __init__(self, defer_indexes=False, defer_stats=False):
+        super().__init__(defer_stats=defer_stats)
+        self.defer_indexes = defer_indexes
+        self.dropped_indexes = None
+        self.game_fields = [field for field in Game._meta.concrete_fields if not field.primary_key]
+
+    def reserve_game_ids(self, cursor, count):
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [Game._meta.db_table, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def drop_indexes(self, cursor):
+        self.dropped_indexes = []
+        for model in (PositionOccurrence, Game):
+            cursor.execute("""
+                SELECT i.relname, pg_get_indexdef(i.oid)
+                FROM pg_index x
+                JOIN pg_class i ON i.oid = x.indexrelid
+                WHERE x.indrelid = %s::regclass
+                  AND NOT x.indisprimary
+                  AND NOT x.indisunique
+                  AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+            """, [model._meta.db_table])
+            self.dropped_indexes.extend(cursor.fetchall())
+
+        for name, definition in self.dropped_indexes:
+            logger.warning(f"Dropping index for bulk load, rebuild with: {definition}")
+            cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+    def write_positions(self, cursor, parsed_games):
+        position_table = Position._meta.db_table
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS position_staging (id bigint, fen varchar(100)) ON COMMIT DELETE ROWS"
+        )
+        copy_rows(cursor, 'position_staging', ['id', 'fen'], unique_positions(parsed_games))
+        cursor.execute(
+            f'INSERT INTO "{position_table}" (id, fen) '
+            f'SELECT id, fen FROM position_staging ORDER BY id ON CONFLICT (id) DO NOTHING'
+        )
+
+    def write(self, parsed_games):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if self.defer_indexes and self.dropped_indexes is None:
+                self.drop_indexes(cursor)
+
+            for game, game_id in zip((game for game, _ in parsed_games),
+                                     self.reserve_game_ids(cursor, len(parsed_games))):
+                game.id = game_id
+
+            copy_rows(
+                cursor,
+                Game._meta.db_table,
+                ['id'] + [field.column for field in self.game_fields],
+                ([game.id] + [getattr(game, field.attname) for field in self.game_fields]
+                 for game, _ in parsed_games),
+            )
+
+            self.write_positions(cursor, parsed_games)
+
+            occurrence_rows = [
+                (position_hash, game.id, ply)
+                for game, positions in parsed_games
+                for ply, (position_hash, _, _) in enumerate(positions)
+            ]
+            copy_rows(cursor, PositionOccurrence._meta.db_table, ['position_id', 'game_id', 'ply'], occurrence_rows)
+
+            self.write_stats(cursor, parsed_games)
+
+        self.games_written += len(parsed_games)
+        self.rows_written += len(parsed_games) + len(occurrence_rows)
+        self.flush_stats_if_full()
+        bump_generation()
+        return len(occurrence_rows)
+
+    def finish(self):
+        self.flush_stats()
+        bump_generation()
+        if not self.dropped_indexes:
+            return
+
+        with connection.cursor() as cursor:
+            for name, definition in self.dropped_indexes:
+                logger.info(f"Rebuilding index {name}")
+                cursor.execute(definition)
+            for model in (Game, Position, PositionOccurrence):
+                cursor.execute(f'ANALYZE "{model._meta.db_table}"')
+        self.dropped_indexes = []
+
+
+def get_bulk_loader(mode=None, defer_indexes=False, defer_stats=False):
+    mode = mode or settings.PGN_BULK_LOADER
+    if mode == 'copy':
+        if connection.vendor == 'postgresql':
+            return CopyLoader(defer_indexes=defer_indexes, defer_stats=defer_stats)
+        logger.warning(f"COPY loader needs PostgreSQL, falling back to the ORM loader on {connection.vendor}.")
+    return OrmLoader(defer_stats=defer_stats)
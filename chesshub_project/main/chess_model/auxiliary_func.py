@@ -67,6 +67,68 @@ def board_to_matrix(board: Board, history_boards, repetition_counter, T=8):
 
     return full_tensor, meta
 
+def piece_bitboards(board: Board):
+    # Isto što i pieces_mask za svaku figuru, redoslijedom ravnina iz board_to_matrix: bijele P..K (0-5), crne P..K (6-11)
+    white = board.occupied_co[chess.WHITE]
+    black = board.occupied_co[chess.BLACK]
+    pieces = (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings)
+    return [mask & white for mask in pieces] + [mask & black for mask in pieces]
+
+def board_bitboards(board: Board, history_boards, repetition_counter, T=8):
+    # Svaka ravnina ulaza kao 64-bitni bitboard (bit i = polje i), istim redoslijedom kao board_to_matrix
+    legal_destinations = 0
+    for move in board.generate_legal_moves():
+        legal_destinations |= chess.BB_SQUARES[move.to_square]
+
+    repetition_count = min(repetition_counter.get(board.board_fen(), 0), 3)
+    history = history_boards[-T:] if T else []
+
+    bitboards = piece_bitboards(board)
+    bitboards.append(legal_destinations)
+    bitboards.extend([chess.BB_ALL] * repetition_count + [0] * (3 - repetition_count))
+    bitboards.extend([0] * (12 * (T - len(history))))
+    for hist_board in history:
+        bitboards.extend(piece_bitboards(hist_board))
+    return bitboards
+
+def board_meta(board: Board):
+    return [
+        1.0 if board.turn == chess.WHITE else 0.0,
+        float(board.has_kingside_castling_rights(chess.WHITE)),
+        float(board.has_queenside_castling_rights(chess.WHITE)),
+        float(board.has_kingside_castling_rights(chess.BLACK)),
+        float(board.has_queenside_castling_rights(chess.BLACK)),
+        1.0 if board.ep_square is not None else 0.0,
+        board.fullmove_number / 100.0,
+    ]
+
+def encode_boards(positions, T=8):
+    """
+    Vectorized ``board_to_matrix`` for a batch of
+    ``(board, history_boards, repetition_counter)`` tuples.
+
+    Returns ``(tensors, metas)`` shaped ``[N, 13 + 3 + 12*T, 8, 8]`` and
+    ``[N, 7]`` (float32), identical to stacking ``board_to_matrix`` outputs.
+    """
+    return encode_bitboards(
+        [board_bitboards(board, history_boards, repetition_counter, T)
+         for board, history_boards, repetition_counter in positions],
+        [board_meta(board) for board, _, _ in positions],
+        T,
+    )
+
+def encode_bitboards(bitboards, metas, T=8):
+    # Lista redaka iz board_bitboards/board_meta -> tenzori; pozivatelj može skupljati retke inkrementalno
+    count = len(bitboards)
+    bitboards = np.array(bitboards, dtype='<u8').reshape(count, 16 + 12 * T)
+    bits = np.unpackbits(bitboards.view(np.uint8), axis=-1, bitorder='little')
+    tensors = bits.reshape(count, 16 + 12 * T, 8, 8).astype(np.float32)
+    return tensors, np.array(metas, dtype=np.float32).reshape(count, 7)
+
+def board_to_matrix_fast(board: Board, history_boards, repetition_counter, T=8):
+    tensors, metas = encode_boards([(board, history_boards, repetition_counter)], T)
+    return tensors[0], metas[0]
+
 def matrix_to_board(tensor, meta):
     board = chess.Board.empty()
     piece_planes = tensor[:12]
@@ -124,92 +186,89 @@ PROMOTION_PIECES = {
     chess.ROOK: 2,
 }
 
+def _build_move_tables():
+    # (from, to, promotion) -> indeks za svih 4672 izlaza politike; promocija u damu se kodira kao obični potez
+    move_index = {}
+    index_moves = {chess.WHITE: [None] * (64 * 73), chess.BLACK: [None] * (64 * 73)}
+
+    for from_square in chess.SQUARES:
+        from_rank, from_file = divmod(from_square, 8)
+        base = from_square * 73
+
+        for dir_idx, (d_rank, d_file) in enumerate(DIRECTIONS):
+            for dist in range(1, 8):
+                to_rank, to_file = from_rank + d_rank * dist, from_file + d_file * dist
+                if 0 <= to_rank < 8 and 0 <= to_file < 8:
+                    index = base + dir_idx * 7 + dist - 1
+                    move = (from_square, to_rank * 8 + to_file, None)
+                    move_index.setdefault(move, index)
+                    move_index.setdefault(move[:2] + (chess.QUEEN,), index)
+                    index_moves[chess.WHITE][index] = index_moves[chess.BLACK][index] = move
+
+        for knight_idx, (kdy, kdx) in enumerate(KNIGHT_DIRS):
+            to_rank, to_file = from_rank + kdy, from_file + kdx
+            if 0 <= to_rank < 8 and 0 <= to_file < 8:
+                index = base + 56 + knight_idx
+                move = (from_square, to_rank * 8 + to_file, None)
+                move_index.setdefault(move, index)
+                index_moves[chess.WHITE][index] = index_moves[chess.BLACK][index] = move
+
+        for color, direction in ((chess.WHITE, 1), (chess.BLACK, -1)):
+            for promotion, piece_idx in PROMOTION_PIECES.items():
+                for dir_idx, dx in enumerate((0, -1, 1)):
+                    to_rank, to_file = from_rank + direction, from_file + dx
+                    if 0 <= to_rank < 8 and 0 <= to_file < 8:
+                        index = base + 64 + piece_idx * 3 + dir_idx
+                        move = (from_square, to_rank * 8 + to_file, promotion)
+                        move_index[move] = index
+                        index_moves[color][index] = move
+
+    return move_index, index_moves
+
+MOVE_INDEX, INDEX_MOVES = _build_move_tables()
+
 def move_to_index(move: chess.Move, board: chess.Board) -> int:
-    from_square = move.from_square
-    to_square = move.to_square
-    from_rank, from_file = divmod(from_square, 8)
-    to_rank, to_file = divmod(to_square, 8)
-    dx = to_file - from_file
-    dy = to_rank - from_rank
-
-    # 1️⃣ PROMOCIJE (64–72)
-    if move.promotion in PROMOTION_PIECES:
-        color = board.piece_at(from_square).color
-        direction = 1 if color == chess.WHITE else -1
-        rel_dir = (dy, dx)
-
-        dir_map = {
-            (direction, 0): 0,   # forward
-            (direction, -1): 1,  # left
-            (direction, 1): 2    # right
-        }
-
-        if rel_dir in dir_map:
-            base_plane = 64 + PROMOTION_PIECES[move.promotion] * 3
-            plane = base_plane + dir_map[rel_dir]
-            return from_rank * 8 * 73 + from_file * 73 + plane
-
-    # 2️⃣ Pravocrtni potezi (0–55)
-    for dir_idx, (d_rank, d_file) in enumerate(DIRECTIONS):
-        for dist in range(1, 8):
-            if dy == d_rank * dist and dx == d_file * dist:
-                plane = dir_idx * 7 + (dist - 1)
-                return from_rank * 8 * 73 + from_file * 73 + plane
-
-    # 3️⃣ Skok konjem (56–63)
-    for knight_idx, (kdy, kdx) in enumerate(KNIGHT_DIRS):
-        if dy == kdy and dx == kdx:
-            plane = 56 + knight_idx
-            return from_rank * 8 * 73 + from_file * 73 + plane
-
-    raise ValueError(f"Move {move.uci()} cannot be encoded with AlphaZero move index.")
+    try:
+        return MOVE_INDEX[(move.from_square, move.to_square, move.promotion)]
+    except KeyError:
+        raise ValueError(f"Move {move.uci()} cannot be encoded with AlphaZero move index.")
 
 def index_to_move(index: int, board: chess.Board) -> chess.Move or str:
-    from_square = index // 73
-    plane = index % 73
-    from_rank, from_file = divmod(from_square, 8)
-
-    if plane < 56:
-        # 1️⃣ Pravocrtni potezi
-        dir_idx = plane // 7
-        dist = (plane % 7) + 1
-        d_rank, d_file = DIRECTIONS[dir_idx]
-        to_rank = from_rank + d_rank * dist
-        to_file = from_file + d_file * dist
-        if not (0 <= to_rank < 8 and 0 <= to_file < 8):
-            return "invalid"
-        to_square = to_rank * 8 + to_file
-        move = chess.Move(from_square, to_square)
-        if move in board.legal_moves:
+    entry = INDEX_MOVES[board.turn][index]
+    if entry is None:
+        return "invalid"
+
+    move = chess.Move(*entry)
+    if board.is_legal(move):
+        return move
+
+    # Promocija u damu dijeli indeks s običnim potezom pješaka
+    if entry[2] is None and board.piece_type_at(entry[0]) == chess.PAWN and chess.square_rank(entry[1]) in (0, 7):
+        move = chess.Move(entry[0], entry[1], chess.QUEEN)
+        if board.is_legal(move):
             return move
 
-    elif 56 <= plane < 64:
-        # 2️⃣ Skokovi konjem
-        knight_idx = plane - 56
-        kdy, kdx = KNIGHT_DIRS[knight_idx]
-        to_rank = from_rank + kdy
-        to_file = from_file + kdx
-        if 0 <= to_rank < 8 and 0 <= to_file < 8:
-            to_square = to_rank * 8 + to_file
-            move = chess.Move(from_square, to_square)
-            if move in board.legal_moves:
-                return move
-
-    elif 64 <= plane < 73:
-        # 3️⃣ Promocije
-        promo_offset = plane - 64
-        piece_idx = promo_offset // 3
-        dir_idx = promo_offset % 3
-        direction = 1 if board.turn == chess.WHITE else -1
-        dx = [0, -1, 1][dir_idx]
-        dy = direction
-        to_rank = from_rank + dy
-        to_file = from_file + dx
-        if 0 <= to_rank < 8 and 0 <= to_file < 8:
-            to_square = to_rank * 8 + to_file
-            promo_piece = list(PROMOTION_PIECES.keys())[piece_idx]
-            move = chess.Move(from_square, to_square, promotion=promo_piece)
-            if move in board.legal_moves:
-                return move
-
     return "invalid"
+
+def legal_move_indices(board: chess.Board):
+    moves = list(board.generate_legal_moves())
+    indices = np.fromiter(
+        (MOVE_INDEX[(move.from_square, move.to_square, move.promotion)] for move in moves),
+        dtype=np.int64,
+        count=len(moves),
+    )
+    return moves, indices
+
+def top_legal_moves(policy_logits, board: chess.Board, k=3):
+    """
+    Returns up to ``k`` legal moves of ``board`` ordered by their policy
+    logits: a gather of the legal move indices followed by a top-k, so the
+    result is never empty while the position has a legal move.
+    """
+    moves, indices = legal_move_indices(board)
+    if not moves:
+        return []
+
+    scores = np.asarray(policy_logits)[indices]
+    order = np.argsort(-scores, kind='stable')[:k]
+    return [moves[i] for i in order]
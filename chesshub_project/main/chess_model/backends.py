@@ -0,0 +1,129 @@
+import logging
+import os
+
+import torch
+from django.conf import settings
+
+from main.model.model import ChessModel
+from main.chess_model.paths import CHECKPOINT_PATH, ONNX_PATH, QUANTIZED_ONNX_PATH, TORCHSCRIPT_PATH
+
+logger = logging.getLogger(__name__)
+
+INPUT_NAMES = ["board", "meta"]
+OUTPUT_NAMES = ["policy_logits", "value"]
+
+
+def load_eager_model(device=None):
+    # mmap + assign: težine ostaju mapirane iz datoteke, pa ih procesi dijele kroz page cache umjesto da svaki drži kopiju
+    device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    state_dict = torch.load(CHECKPOINT_PATH, map_location="cpu", mmap=True, weights_only=True)
+    model = ChessModel()
+    model.load_state_dict(state_dict, assign=True)
+    model.to(device)
+    model.eval()
+    return model
+
+
+class TorchBackend:
+    name = 'torch'
+
+    def __init__(self, model=None):
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = model or load_eager_model(self.device)
+
+    def run(self, board_tensor, meta):
+        # Ulaz i izlaz su NumPy nizovi, isti ugovor za sve backende
+        with torch.no_grad():
+            policy_logits, value = self.model(
+                torch.from_numpy(board_tensor).to(self.device),
+                torch.from_numpy(meta).to(self.device),
+            )
+        return policy_logits.cpu().numpy(), value.cpu().numpy()
+
+
+class TorchScriptBackend(TorchBackend):
+    name = 'torchscript'
+
+    def __init__(self, path=TORCHSCRIPT_PATH):
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model = torch.jit.optimize_for_inference(torch.jit.load(path, map_location=device).eval())
+        super().__init__(model)
+
+
+class OnnxBackend:
+    name = 'onnx'
+
+    def __init__(self, path=ONNX_PATH, intra_op_threads=None):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = settings.ONNX_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+        options.inter_op_num_threads = 1
+
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        logger.info(f"Loaded ONNX model {path} with {options.intra_op_num_threads or 'default'} intra-op threads")
+
+    def run(self, board_tensor, meta):
+        policy_logits, value = self.session.run(OUTPUT_NAMES, {"board": board_tensor, "meta": meta})
+        return policy_logits, value
+
+
+BACKENDS = {
+    'torch': TorchBackend,
+    'torchscript': TorchScriptBackend,
+    'onnx': OnnxBackend,
+    'onnx-int8': lambda: OnnxBackend(QUANTIZED_ONNX_PATH),
+}
+
+
+def load_backend(name=None):
+    name = name or settings.CHESS_MODEL_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown chess model backend '{name}', expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def example_inputs(batch_size=1):
+    return torch.zeros(batch_size, 112, 8, 8), torch.zeros(batch_size, 7)
+
+
+def export_torchscript(model, path=TORCHSCRIPT_PATH):
+    traced = torch.jit.trace(model.cpu().eval(), example_inputs())
+    traced.save(path)
+    return path
+
+
+def export_onnx(model, path=ONNX_PATH, opset=17):
+    torch.onnx.export(
+        model.cpu().eval(),
+        example_inputs(),
+        path,
+        input_names=INPUT_NAMES,
+        output_names=OUTPUT_NAMES,
+        dynamic_axes={name: {0: "batch"} for name in INPUT_NAMES + OUTPUT_NAMES},
+        opset_version=opset,
+        dynamo=False,
+    )
+    return path
+
+
+def quantize_onnx(source=ONNX_PATH, target=QUANTIZED_ONNX_PATH):
+    # Dinamička int8 kvantizacija težina za konvolucije i potpuno povezane slojeve
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    preprocessed = f"{target}.pre.onnx"
+    quant_pre_process(source, preprocessed)
+    try:
+        quantize_dynamic(
+            preprocessed,
+            target,
+            op_types_to_quantize=["Conv", "MatMul", "Gemm"],
+            weight_type=QuantType.QUInt8,
+        )
+    finally:
+        os.remove(preprocessed)
+    return target
+
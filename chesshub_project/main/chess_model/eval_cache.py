@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .paths import CHECKPOINT_PATH
+
+logger = logging.getLogger(__name__)
+
+STAT_NAMES = ('local_hits', 'shared_hits', 'misses')
+
+_version = None
+
+
+def model_version():
+    # Promjena checkpointa ili backenda mijenja sve ključeve, pa stare evaluacije nikad ne izlaze
+    global _version
+    if _version is None:
+        if settings.CHESS_MODEL_VERSION:
+            _version = settings.CHESS_MODEL_VERSION
+        else:
+            try:
+                stat = os.stat(CHECKPOINT_PATH)
+                _version = f"{settings.CHESS_MODEL_BACKEND}-{stat.st_size}-{stat.st_mtime_ns}"
+            except OSError:
+                _version = settings.CHESS_MODEL_BACKEND
+    return _version
+
+
+def eval_key(fen, history=()):
+    """
+    Cache key of one evaluation: the model version, the FEN and exactly the
+    parts of the history that ``board_to_matrix`` consumes, i.e. the piece
+    placement of the last 8 positions and the repetition count.
+    """
+    history = list(history)
+    placement = fen.split()[0] if fen.split() else fen
+    repetitions = min(sum(1 for previous in history + [fen] if previous == placement), 3)
+    raw = '|'.join([model_version(), fen.strip(), str(repetitions)] + [h.split()[0] for h in history[-8:] if h.split()])
+    return f"eval:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+class EvalCache:
+    def __init__(self, max_size=10000, timeout=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = dict.fromkeys(STAT_NAMES, 0)
+        self.unflushed = dict.fromkeys(STAT_NAMES, 0)
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+            self.unflushed[stat] += 1
+            pending = sum(self.unflushed.values())
+        if pending >= settings.EVAL_CACHE_STATS_FLUSH:
+            self.flush_stats()
+
+    def flush_stats(self):
+        # Zajednički brojači u Redisu se pišu u paketima, ne pri svakom pogotku
+        with self.lock:
+            unflushed, self.unflushed = self.unflushed, dict.fromkeys(STAT_NAMES, 0)
+        for stat, delta in unflushed.items():
+            if not delta:
+                continue
+            key = f"eval_cache:stats:{stat}"
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                if not cache.add(key, delta, timeout=None):
+                    cache.incr(key, delta)
+
+    def remember(self, key, result):
+        with self.lock:
+            self.local[key] = result
+            self.local.move_to_end(key)
+            while len(self.local) > self.max_size:
+                self.local.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            result = self.local.get(key)
+            if result is not None:
+                self.local.move_to_end(key)
+        if result is not None:
+            self.count('local_hits')
+            return result
+
+        result = cache.get(key)
+        if result is not None:
+            self.remember(key, result)
+            self.count('shared_hits')
+            return result
+
+        self.count('misses')
+        return None
+
+    def set(self, key, result):
+        self.remember(key, result)
+        cache.set(key, result, timeout=self.timeout)
+
+    def summary(self):
+        with self.lock:
+            local = dict(self.stats)
+            size = len(self.local)
+
+        self.flush_stats()
+        shared = {stat: cache.get(f"eval_cache:stats:{stat}", 0) for stat in STAT_NAMES}
+
+        def with_hit_rate(stats):
+            lookups = sum(stats.values())
+            hits = stats['local_hits'] + stats['shared_hits']
+            return {**stats, 'lookups': lookups, 'hit_rate': round(hits / lookups, 4) if lookups else None}
+
+        return {
+            'model_version': model_version(),
+            'process': {**with_hit_rate(local), 'pid': os.getpid(), 'local_entries': size},
+            'all_processes': with_hit_rate(shared),
+        }
+
+
+_eval_cache = None
+_eval_cache_lock = threading.Lock()
+
+
+def get_eval_cache():
+    global _eval_cache
+    if _eval_cache is None:
+        with _eval_cache_lock:
+            if _eval_cache is None:
+                _eval_cache = EvalCache(settings.EVAL_CACHE_LOCAL_SIZE, settings.EVAL_CACHE_TIMEOUT)
+    return _eval_cache
@@ -1,56 +1,115 @@
-import torch
 import chess
-from main.model.model import ChessModel
-from main.chess_model.auxiliary_func import board_to_matrix, index_to_move
-from collections import Counter
-import os
+import numpy as np
+from main.chess_model.auxiliary_func import board_bitboards, board_meta, board_to_matrix_fast, encode_bitboards, encode_boards, top_legal_moves
+from main.chess_model.backends import load_backend
+import threading
+from collections import Counter, deque
 
-model_path = os.path.join(os.path.dirname(__file__), "..", "model", "best_model.pt")
+_backend = None
+_backend_lock = threading.Lock()
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-model = ChessModel()
-model.load_state_dict(torch.load(model_path, map_location=device))
-model.to(device)
-model.eval()
+def get_backend():
+    # Model se učitava pri prvoj evaluaciji, ne pri importu
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = load_backend()
+    return _backend
 
-game_history = []
 
-def evaluate_fen(fen: str):
-    global game_history
-
-    print("📥 Received FEN:", fen)
-    print("📚 Game history (last 8):", game_history[-8:])
-    
+def prepare_input(fen: str, history=()):
+    # Povijest dolazi uz svaki zahtjev, nema dijeljenog globalnog stanja između korisnika
+    history = list(history)
     board = chess.Board(fen)
-    history_boards = [chess.Board(f) for f in game_history[-8:]]
-
-    rep_counter = Counter(game_history + [fen])
-
-    board_tensor, meta = board_to_matrix(board, history_boards, rep_counter)
-    board_tensor = torch.tensor(board_tensor, dtype=torch.float32).unsqueeze(0).to(device)
-    meta_tensor = torch.tensor(meta, dtype=torch.float32).unsqueeze(0).to(device)
-
-    # 🧾 Logovi za potvrdu
-    print("🧮 Meta tensor:", meta_tensor.cpu().numpy().round(3).tolist())
-    print("📐 Board tensor shape:", board_tensor.shape)
-    print("📊 History boards FENs:")
-    for i, b in enumerate(history_boards):
-        print(f"  {i+1}. {b.fen()}")
-
-    with torch.no_grad():
-        policy_logits, value = model(board_tensor, meta_tensor)
-        top_k = torch.topk(policy_logits, k=3, dim=1)
-        top_indices = top_k.indices[0].cpu().numpy()
-        top_moves = []
-
-        for idx in top_indices:
-            move = index_to_move(idx, board)
-            if move != "invalid":
-                top_moves.append(move.uci())
-
-        eval_score = round(value.item(), 2)
-        return {
-            "eval": eval_score,
-            "best_moves": top_moves
-        }
+    history_boards = [chess.Board(f) for f in history[-8:]]
+
+    rep_counter = Counter(history + [fen])
+
+    board_tensor, meta = board_to_matrix_fast(board, history_boards, rep_counter)
+    return board, board_tensor, meta
+
+
+def evaluate_batch(inputs):
+    """
+    Evaluates a list of ``(board, board_tensor, meta)`` tuples from
+    ``prepare_input`` with a single forward pass and returns one
+    ``{"eval", "best_moves"}`` dict per input, in order.
+    """
+    if not inputs:
+        return []
+
+    policy_logits, values = get_backend().run(
+        np.stack([tensor for _, tensor, _ in inputs]),
+        np.stack([meta for _, _, meta in inputs]),
+    )
+
+    # Top-k samo nad indeksima legalnih poteza, pa best_moves nije prazan dok postoji legalan potez
+    return [{
+        "eval": round(float(eval_value), 2),
+        "best_moves": [move.uci() for move in top_legal_moves(logits, board, k=3)]
+    } for (board, _, _), logits, eval_value in zip(inputs, policy_logits, values)]
+
+
+def evaluate_fen(fen: str, history=()):
+    return evaluate_batch([prepare_input(fen, history)])[0]
+
+
+def run_encoded(boards, board_tensors, metas):
+    # Jedan prolaz kroz model; vraća (eval, najbolji legalni potez ili None) za svaku ploču
+    policy_logits, values = get_backend().run(board_tensors, metas)
+    results = []
+    for board, logits, eval_value in zip(boards, policy_logits, values):
+        best = top_legal_moves(logits, board, k=1)
+        results.append((round(float(eval_value), 2), best[0].uci() if best else None))
+    return results
+
+
+def evaluate_boards(boards):
+    # Pozicije bez povijesti, kao evaluate_fen(fen) bez history
+    return run_encoded(boards, *encode_boards([(board, [], Counter([board.fen()])) for board in boards]))
+
+
+def evaluate_game(moves, board=None, batch_size=256):
+    """
+    Evaluates every position of a game, the start position included, and
+    returns ``(evals, best_moves)`` with one entry per ply.
+
+    The game is replayed once; the history and repetition counts are carried
+    along instead of being rebuilt from FENs for each position, and the
+    encoded positions go through the backend ``batch_size`` at a time.
+    """
+    board = board.copy(stack=False) if board is not None else chess.Board()
+    history = deque(maxlen=8)
+    repetitions = Counter()
+    evals, best_moves = [], []
+    boards, bitboards, metas = [], [], []
+
+    def flush():
+        for eval_value, best_move in run_encoded(boards, *encode_bitboards(bitboards, metas)):
+            evals.append(eval_value)
+            best_moves.append(best_move)
+        boards.clear()
+        bitboards.clear()
+        metas.clear()
+
+    for move in [None] + list(moves):
+        if move is not None:
+            history.append(board.copy(stack=False))
+            board.push(move)
+        repetitions[board.fen()] += 1
+
+        position = board.copy(stack=False)
+        if position.ep_square is not None and not position.has_legal_en_passant():
+            # Kao chess.Board(fen): FEN sadrži en passant polje samo ako je uzimanje legalno
+            position.ep_square = None
+        boards.append(position)
+        bitboards.append(board_bitboards(position, list(history), repetitions))
+        metas.append(board_meta(position))
+        if len(boards) >= batch_size:
+            flush()
+
+    if boards:
+        flush()
+    return evals, best_moves
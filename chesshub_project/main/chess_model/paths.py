@@ -0,0 +1,8 @@
+import os
+
+# Putanje modela bez importa torcha, da ih web procesi mogu koristiti
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "model")
+CHECKPOINT_PATH = os.path.join(MODEL_DIR, "best_model.pt")
+TORCHSCRIPT_PATH = os.path.join(MODEL_DIR, "best_model.ts")
+ONNX_PATH = os.path.join(MODEL_DIR, "best_model.onnx")
+QUANTIZED_ONNX_PATH = os.path.join(MODEL_DIR, "best_model.int8.onnx")
@@ -0,0 +1,121 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+
+from .eval_cache import eval_key, get_eval_cache
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluationService:
+    """
+    Groups concurrent evaluation requests into micro-batches.
+
+    Callers encode their own position (``prepare_input``) and enqueue it; a
+    single worker thread waits for up to ``max_wait_ms`` after the first
+    request, or until ``max_batch`` requests are queued, and runs them through
+    the model in one forward pass. Each caller gets its own result through a
+    ``Future``.
+    """
+
+    def __init__(self, max_batch=32, max_wait_ms=5):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, name="evaluation-service", daemon=True)
+                self.worker.start()
+
+    def submit(self, fen, history=()):
+        from .evaluation import prepare_input
+
+        # Kodiranje ide u dretvi zahtjeva, pa neispravan FEN odmah vraća grešku samo tom pozivatelju
+        future = Future()
+        self.requests.put((prepare_input(fen, history), future))
+        self.start()
+        return future
+
+    def evaluate(self, fen, history=(), timeout=None):
+        return self.submit(fen, history).result(timeout=timeout)
+
+    def next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        from .evaluation import evaluate_batch
+
+        while True:
+            batch = self.next_batch()
+            batch = [(inputs, future) for inputs, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                results = evaluate_batch([inputs for inputs, _ in batch])
+            except Exception as e:
+                logger.exception("Batch evaluation failed")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            logger.debug(f"Evaluated batch of {len(batch)} positions")
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_evaluation_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EvaluationService(settings.EVAL_MAX_BATCH, settings.EVAL_MAX_WAIT_MS)
+    return _service
+
+
+def evaluate_position(fen, history=(), timeout=None):
+    """
+    Evaluates one position for the web views.
+
+    Repeated positions with the same history cost one cache lookup. On a miss
+    the position goes to the in-process service, or with ``EVAL_MODE=celery``
+    to the dedicated ``eval_queue`` worker, so web processes never load torch.
+    """
+    eval_cache = get_eval_cache()
+    key = eval_key(fen, history)
+    result = eval_cache.get(key)
+    if result is not None:
+        return result
+
+    if settings.EVAL_MODE == 'celery':
+        from main.tasks import evaluate_position_task
+
+        result = evaluate_position_task.delay(fen, list(history)).get(timeout=timeout)
+    else:
+        result = get_evaluation_service().evaluate(fen, history, timeout=timeout)
+
+    eval_cache.set(key, result)
+    return result
@@ -1,21 +1,30 @@
 import json
 import logging
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.core.cache import cache
+
+from .game_cache import cached_list
+from .game_queries import GAME_LIST_FIELDS, PAGE_SIZE
+from .models import Game
 
 logger = logging.getLogger(__name__)
 
+
+def latest_games():
+    return cached_list('latest', {}, lambda: list(
+        Game.objects.order_by('-id').values(*GAME_LIST_FIELDS)[:PAGE_SIZE]
+    ))
+
+
 class GameConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         await self.channel_layer.group_add("games_group", self.channel_name)
         await self.accept()
         logger.info(f"Client connected: {self.channel_name}")
 
-        total_pages_key = 'games_total_pages'
-        total_pages = cache.get(total_pages_key, 1)
-        last_page_data = cache.get(f'games_page_{total_pages}', {"games": []})
+        games = await database_sync_to_async(latest_games)()
 
-        await self.send(text_data=json.dumps({"games": last_page_data["games"], "current_page": total_pages}))
+        await self.send(text_data=json.dumps({"games": games}, default=str))
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard("games_group", self.channel_name)
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'games_list:generation'
+LIST_PARAMS = (
+    'date_from', 'date_to', 'white_elo_filter', 'white_elo', 'black_elo_filter', 'black_elo',
+    'result', 'sort_by_date', 'page', 'cursor',
+)
+
+
+def current_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
+
+
+def bump_generation():
+    # Nova generacija čini sve stare liste nevidljivima; stari ključevi sami isteknu
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 2, timeout=None)
+        return cache.get(GENERATION_KEY, 2)
+
+
+def normalize_params(params, extra=None):
+    normalized = {}
+    for key in LIST_PARAMS:
+        value = params.get(key)
+        if value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            normalized[key] = value
+
+    if normalized.get('page') == '1':
+        del normalized['page']
+    normalized.update(extra or {})
+    return normalized
+
+
+def list_cache_key(scope, params, extra=None):
+    raw = json.dumps(normalize_params(params, extra), sort_keys=True)
+    digest = hashlib.sha1(raw.encode()).hexdigest()
+    return f'games_list:{current_generation()}:{scope}:{digest}'
+
+
+def cached_list(scope, params, build, extra=None):
+    """
+    Returns the cached payload for one game-list query, building it on a miss.
+
+    Keys carry the list generation, so ingestion invalidates every list with a
+    single ``bump_generation()``. Only one caller per key rebuilds the payload;
+    the others poll the cache for up to ``GAME_LIST_LOCK_WAIT`` seconds before
+    falling back to building it themselves.
+    """
+    key = list_cache_key(scope, params, extra)
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, timeout=settings.GAME_LIST_LOCK_TIMEOUT):
+        try:
+            data = build()
+            cache.set(key, data, timeout=settings.GAME_LIST_CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return data
+
+    deadline = time.monotonic() + settings.GAME_LIST_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        data = cache.get(key)
+        if data is not None:
+            return data
+
+    logger.warning(f"Timed out waiting for {key}, building it without the cache.")
+    return build()
+
+
+def cached_count(scope, params, count, extra=None):
+    # Broj rezultata ne ovisi o stranici, pa se dijeli između svih stranica istog filtera
+    filters = {key: value for key, value in params.items() if key not in ('page', 'cursor')}
+    return cached_list(f'{scope}:count', filters, count, extra)
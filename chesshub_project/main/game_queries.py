@@ -0,0 +1,225 @@
+import base64
+import json
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import BooleanField, Case, Count, F, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import ExtractYear, Substr
+
+from .models import Game, GameFacetCount
+
+PAGE_SIZE = 100
+SORT_FIELDS = ('-date', 'date', 'id', '-id')
+GAME_LIST_FIELDS = ('id', 'white_player', 'white_elo', 'black_player', 'black_elo', 'result', 'date', 'site')
+GAME_COUNT_CACHE_KEY = 'games_total_count'
+FACETS = ('result', 'eco', 'elo', 'year')
+ELO_BUCKET = 200
+
+
+def apply_game_filters(games, filters):
+    if filters.get('date_from') and filters.get('date_to'):
+        games = games.filter(date__range=[filters['date_from'], filters['date_to']])
+
+    for color in ('white', 'black'):
+        lookup = filters.get(f'{color}_elo_filter')
+        elo = filters.get(f'{color}_elo')
+        if lookup in ('exact', 'gte', 'lte') and elo:
+            games = games.filter(**{f'{color}_elo__{lookup}': elo})
+
+    if filters.get('result'):
+        games = games.filter(result=filters['result'])
+
+    return games
+
+
+def encode_cursor(value, last_id):
+    raw = json.dumps([value, last_id], cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(last_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def ordering_for(sort_field):
+    field = sort_field.lstrip('-')
+    descending = sort_field.startswith('-')
+    if field == 'id':
+        return field, descending, ['-id' if descending else 'id']
+    # NULL datumi uvijek idu na kraj, u oba smjera
+    order = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+    return field, descending, [order, '-id' if descending else 'id']
+
+
+def rows_after_cursor(games, field, descending, cursor, limit):
+    """
+    Returns up to ``limit`` rows of the ordered ``games`` that follow the
+    cursor. Rows with a date are fetched with a row comparison
+    ``(date, id) < (value, id)``, which the matching ``(date, id)`` index
+    serves as a single range scan; the NULL-date tail is read separately
+    once they run out.
+    """
+    value, last_id = decode_cursor(cursor)
+    op = 'lt' if descending else 'gt'
+
+    if field == 'id':
+        return list(games.filter(**{f'id__{op}': last_id})[:limit])
+    if value is None:
+        return list(games.filter(**{f'{field}__isnull': True, f'id__{op}': last_id})[:limit])
+
+    table = connection.ops.quote_name(Game._meta.db_table)
+    comparison = RawSQL(
+        f'({table}.{connection.ops.quote_name(field)}, {table}."id") {"<" if descending else ">"} (%s, %s)',
+        (value, last_id),
+        output_field=BooleanField(),
+    )
+    rows = list(games.filter(comparison)[:limit])
+    if len(rows) < limit:
+        rows += list(games.filter(**{f'{field}__isnull': True})[:limit - len(rows)])
+    return rows
+
+
+def bounded_count(games, cap=None):
+    # COUNT nad LIMIT-iranim podupitom: trošak je ograničen bez obzira na veličinu tablice
+    cap = cap or settings.GAME_LIST_COUNT_CAP
+    return games.order_by()[:cap].count()
+
+
+def approximate_game_count():
+    # Procjena iz statistike planera (pg_class.reltuples) umjesto COUNT(*) nad cijelom tablicom; male tablice se broje točno
+    count = cache.get(GAME_COUNT_CACHE_KEY)
+    if count is not None:
+        return count
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [Game._meta.db_table])
+            row = cursor.fetchone()
+        count = row[0] if row else -1
+
+    # reltuples je -1 dok tablica nije analizirana
+    if count is None or count < settings.GAME_LIST_COUNT_CAP:
+        count = Game.objects.count()
+
+    cache.set(GAME_COUNT_CACHE_KEY, count, settings.GAME_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def paginate_games(params, games, sort_field='-date', fields=GAME_LIST_FIELDS, total_count=None):
+    """
+    Returns one page of ``games`` as the JSON payload used by the game lists.
+
+    With a ``cursor`` parameter the page is fetched by keyset on
+    ``(sort field, id)``; otherwise the legacy ``page`` number is used with an
+    OFFSET. Both modes return ``next_cursor``. ``total_pages`` comes from
+    ``total_count`` when the caller has a cheap count, else from a count capped
+    at ``GAME_LIST_COUNT_CAP`` rows.
+    """
+    if sort_field not in SORT_FIELDS:
+        sort_field = '-date'
+    field, descending, ordering = ordering_for(sort_field)
+
+    try:
+        page = max(int(params.get('page', 1)), 1)
+    except (TypeError, ValueError):
+        page = 1
+
+    if total_count is None:
+        total_count = bounded_count(games)
+    total_pages = math.ceil(total_count / PAGE_SIZE)
+
+    ordered = games.order_by(*ordering).values(*fields)
+    cursor = params.get('cursor')
+    if cursor:
+        rows = rows_after_cursor(ordered, field, descending, cursor, PAGE_SIZE + 1)
+    else:
+        offset = (page - 1) * PAGE_SIZE
+        rows = list(ordered[offset:offset + PAGE_SIZE + 1])
+
+    next_cursor = None
+    if len(rows) > PAGE_SIZE:
+        rows = rows[:PAGE_SIZE]
+        next_cursor = encode_cursor(rows[-1][field], rows[-1]['id'])
+        # Brojanje je ograničeno, pa uvijek ostavi barem jednu sljedeću stranicu kad ona postoji
+        total_pages = max(total_pages, page + 1)
+
+    return {
+        'games': rows,
+        'total_pages': total_pages,
+        'current_page': page,
+        'next_cursor': next_cursor,
+    }
+
+
+def elo_bucket(white_elo, black_elo):
+    if not white_elo or not black_elo:
+        return 'unrated'
+    return str((white_elo + black_elo) // 2 // ELO_BUCKET * ELO_BUCKET)
+
+
+def facet_values(result, eco, white_elo, black_elo, date):
+    # Ista pravila za sažetak pri unosu i za agregate nad filtriranim upitom
+    year = date.year if hasattr(date, 'year') else date
+    return [
+        ('result', result or '?'),
+        ('eco', eco[0].upper() if eco else '?'),
+        ('elo', elo_bucket(white_elo, black_elo)),
+        ('year', str(year) if year else '?'),
+    ]
+
+
+def summary_facets():
+    facets = {facet: [] for facet in FACETS}
+    for facet, value, games in GameFacetCount.objects.filter(games__gt=0).values_list('facet', 'value', 'games'):
+        facets[facet].append({'value': value, 'games': games})
+    return facets
+
+
+def aggregate_facets(games):
+    """
+    Computes the facets of an arbitrary game queryset with one GROUP BY per
+    facet. The grouping expressions mirror ``facet_values`` so the result
+    matches the ingestion-maintained summary table.
+    """
+    rated = Q(white_elo__gt=0, black_elo__gt=0)
+    expressions = {
+        'result': F('result'),
+        'eco': Substr('eco', 1, 1),
+        'elo': Case(
+            When(rated, then=(F('white_elo') + F('black_elo')) / 2 / ELO_BUCKET * ELO_BUCKET),
+            default=Value(None),
+            output_field=IntegerField(),
+        ),
+        'year': ExtractYear('date'),
+    }
+
+    facets = {facet: [] for facet in FACETS}
+    for facet, expression in expressions.items():
+        counts = {}
+        rows = games.order_by().annotate(facet_value=expression).values('facet_value').annotate(games=Count('id'))
+        for row in rows:
+            value = row['facet_value']
+            if facet == 'elo':
+                value = str(value) if value is not None else 'unrated'
+            elif facet == 'eco':
+                value = value.upper() if value else '?'
+            else:
+                value = str(value) if value else '?'
+            counts[value] = counts.get(value, 0) + row['games']
+        facets[facet] = [{'value': value, 'games': count} for value, count in counts.items()]
+    return facets
+
+
+def game_facets(games, has_filters):
+    facets = aggregate_facets(games) if has_filters else summary_facets()
+    for facet in FACETS:
+        facets[facet].sort(key=lambda item: (-item['games'], item['value']))
+    return facets
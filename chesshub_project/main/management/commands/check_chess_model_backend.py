@@ -0,0 +1,77 @@
+import random
+import time
+from collections import Counter
+
+import chess
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from main.chess_model.auxiliary_func import encode_boards, top_legal_moves
+from main.chess_model.backends import BACKENDS, TorchBackend, load_backend
+
+
+def random_positions(count, seed):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = chess.Board()
+        history = []
+        for _ in range(rng.randint(1, 100)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            history.append(board.fen())
+            board.push(rng.choice(moves))
+        if board.is_game_over():
+            continue
+        positions.append((board, [chess.Board(fen) for fen in history[-8:]], Counter(history + [board.fen()])))
+    return positions
+
+
+def per_position_ms(backend, tensors, metas, batch_size):
+    started = time.perf_counter()
+    for i in range(0, len(tensors), batch_size):
+        backend.run(tensors[i:i + batch_size], metas[i:i + batch_size])
+    return (time.perf_counter() - started) * 1000 / len(tensors)
+
+
+class Command(BaseCommand):
+    help = "Compares a chess model backend against the fp32 PyTorch model: eval error, top-move agreement and latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument('backend', choices=list(BACKENDS))
+        parser.add_argument('--positions', type=int, default=512)
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        positions = random_positions(options['positions'], options['seed'])
+        tensors, metas = encode_boards(positions)
+
+        reference = TorchBackend()
+        candidate = load_backend(options['backend'])
+
+        ref_policy, ref_value = reference.run(tensors, metas)
+        policy, value = candidate.run(tensors, metas)
+
+        eval_error = np.abs(np.round(ref_value, 2) - np.round(value, 2))
+        top1 = top3 = 0
+        for (board, _, _), ref_logits, logits in zip(positions, ref_policy, policy):
+            ref_moves = top_legal_moves(ref_logits, board, k=3)
+            moves = top_legal_moves(logits, board, k=3)
+            top1 += ref_moves[0] == moves[0]
+            top3 += len(set(ref_moves) & set(moves)) / len(ref_moves)
+
+        count = len(positions)
+        self.stdout.write(f"Positions: {count}")
+        self.stdout.write(f"Eval abs error: mean {eval_error.mean():.4f}, max {eval_error.max():.4f}")
+        self.stdout.write(f"Top-1 agreement: {top1 * 100 / count:.1f}%")
+        self.stdout.write(f"Top-3 overlap: {top3 * 100 / count:.1f}%")
+
+        for name, backend in (('torch fp32', reference), (options['backend'], candidate)):
+            single = per_position_ms(backend, tensors[:64], metas[:64], 1)
+            batched = per_position_ms(backend, tensors, metas, options['batch_size'])
+            self.stdout.write(
+                f"{name:>12}: {single:.2f} ms/eval at batch 1, "
+                f"{batched:.2f} ms/position at batch {options['batch_size']}"
+            )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from main.chess_model.backends import (
+    ONNX_PATH, QUANTIZED_ONNX_PATH, TORCHSCRIPT_PATH,
+    export_onnx, export_torchscript, load_eager_model, quantize_onnx,
+)
+
+
+class Command(BaseCommand):
+    help = "Exports best_model.pt to TorchScript and ONNX, optionally with a dynamically quantized int8 ONNX model."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--opset', type=int, default=17)
+        parser.add_argument('--quantize', action='store_true', help=f"Also write {QUANTIZED_ONNX_PATH}.")
+        parser.add_argument('--skip-torchscript', action='store_true')
+
+    def handle(self, *args, **options):
+        import torch
+
+        model = load_eager_model(torch.device("cpu"))
+
+        if not options['skip_torchscript']:
+            self.stdout.write(f"TorchScript: {export_torchscript(model, TORCHSCRIPT_PATH)}")
+
+        self.stdout.write(f"ONNX: {export_onnx(model, ONNX_PATH, options['opset'])}")
+
+        if options['quantize']:
+            self.stdout.write(f"ONNX int8: {quantize_onnx(ONNX_PATH, QUANTIZED_ONNX_PATH)}")
+
+        self.stdout.write(self.style.SUCCESS("Export finished, select it with CHESS_MODEL_BACKEND."))
@@ -0,0 +1,124 @@
+import collections
+import io
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from main.bulk_loader import get_bulk_loader
+from main.models import Game
+from main.pgn_utils import PGN_ENCODING, iter_raw_games, parse_pgn_game
+
+
+def find_game_boundaries(pgn_file_path, range_bytes):
+    # Granica partije je linija s tagom koja dolazi nakon prazne linije
+    size = os.path.getsize(pgn_file_path)
+    offsets = [0]
+
+    with open(pgn_file_path, 'rb') as pgn_file:
+        for target in range(range_bytes, size, range_bytes):
+            if target <= offsets[-1]:
+                continue
+
+            pgn_file.seek(target)
+            pgn_file.readline()
+            previous_blank = False
+
+            while True:
+                position = pgn_file.tell()
+                line = pgn_file.readline()
+                if not line:
+                    break
+                if previous_blank and line.startswith(b'['):
+                    offsets.append(position)
+                    break
+                previous_blank = not line.strip()
+
+    return list(zip(offsets, offsets[1:] + [size]))
+
+
+def parse_range(task):
+    pgn_file_path, start, end = task
+    with open(pgn_file_path, 'rb') as pgn_file:
+        pgn_file.seek(start)
+        data = pgn_file.read(end - start).decode(PGN_ENCODING)
+
+    parsed_games = []
+    for _, pgn_text, _, _ in iter_raw_games(io.StringIO(data)):
+        parsed = parse_pgn_game(pgn_text)
+        if parsed is not None:
+            parsed_games.append(parsed)
+    return end - start, parsed_games
+
+
+def bounded_imap(pool, func, tasks, window):
+    # imap_unordered šalje sve rangeove odjednom i gomila rezultate dok ih roditelj ne upiše;
+    # ovdje je u letu najviše window rangeova, pa memorija ne raste s veličinom arhive
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+class Command(BaseCommand):
+    help = "Imports a PGN archive in parallel: byte ranges are parsed in a process pool and written through a bulk loader."
+
+    def add_arguments(self, parser):
+        parser.add_argument('pgn_file_path')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--range-mb', type=int, default=4, help="Size of the byte range handed to one worker.")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Games per bulk write.")
+        parser.add_argument('--loader', choices=['orm', 'copy'], default=None, help="Defaults to PGN_BULK_LOADER.")
+        parser.add_argument('--defer-indexes', action='store_true')
+
+    def handle(self, *args, **options):
+        pgn_file_path = options['pgn_file_path']
+        if not os.path.exists(pgn_file_path):
+            raise CommandError(f"File not found: {pgn_file_path}")
+
+        ranges = find_game_boundaries(pgn_file_path, options['range_mb'] * 1024 * 1024)
+        total_bytes = ranges[-1][1] if ranges else 0
+        self.stdout.write(f"Split {pgn_file_path} into {len(ranges)} ranges, parsing with {options['workers']} workers.")
+
+        # Agregati otvaranja i faseta pribrajaju se u memoriji i upisuju jednom u loader.finish()
+        loader = get_bulk_loader(options['loader'], defer_indexes=options['defer_indexes'], defer_stats=True)
+        started = time.perf_counter()
+        bytes_done = 0
+        batch = []
+
+        # Workeri ne koriste bazu, a forkane konekcije se ne smiju dijeliti
+        connections.close_all()
+
+        with multiprocessing.get_context('fork').Pool(options['workers']) as pool:
+            tasks = ((pgn_file_path, start, end) for start, end in ranges)
+            for range_bytes, parsed_games in bounded_imap(pool, parse_range, tasks, 2 * options['workers']):
+                batch.extend((Game(**fields), positions) for fields, positions in parsed_games)
+                bytes_done += range_bytes
+
+                if len(batch) >= options['batch_size']:
+                    loader.write(batch)
+                    batch = []
+                    self.report(loader, bytes_done, total_bytes, started)
+
+        if batch:
+            loader.write(batch)
+
+        loader.finish()
+        self.report(loader, bytes_done, total_bytes, started)
+        self.stdout.write(self.style.SUCCESS(f"Imported {loader.games_written} games ({loader.rows_written} rows)."))
+
+    def report(self, loader, bytes_done, total_bytes, started):
+        elapsed = time.perf_counter() - started
+        megabytes = bytes_done / (1024 * 1024)
+        self.stdout.write(
+            f"{bytes_done * 100 / max(total_bytes, 1):5.1f}% | "
+            f"{loader.games_written} games | "
+            f"{loader.games_written / elapsed:.0f} games/s | "
+            f"{loader.rows_written / elapsed:.0f} rows/s | "
+            f"{megabytes / elapsed:.1f} MB/s"
+        )
@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.game_cache import bump_generation
+from main.models import FENPosition, Position, PositionOccurrence
+from main.pgn_utils import fen_hash, normalize_fen
+
+CHECKPOINT_KEY = 'migrate_fen_positions:last_id'
+
+
+class Command(BaseCommand):
+    help = "Copies legacy FENPosition rows into the deduplicated Position/PositionOccurrence tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--start-id', type=int, default=None,
+                            help="Resume after this FENPosition id. Defaults to the checkpoint of the previous run.")
+        parser.add_argument('--delete', action='store_true', help="Delete each FENPosition batch once it is migrated.")
+
+    def handle(self, *args, **options):
+        last_id = options['start_id']
+        if last_id is None:
+            last_id = cache.get(CHECKPOINT_KEY, 0)
+            if last_id:
+                self.stdout.write(f"Resuming after FENPosition id {last_id}")
+        migrated = 0
+
+        while True:
+            batch = list(
+                FENPosition.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'fen_string', 'position_hash', 'game_id', 'move_number')[:options['batch_size']]
+            )
+            if not batch:
+                break
+
+            positions = {}
+            occurrences = []
+            for _, fen, position_hash, game_id, move_number in batch:
+                if position_hash is None:
+                    if not fen:
+                        continue
+                    position_hash = fen_hash(fen)
+                if position_hash not in positions or positions[position_hash] is None:
+                    positions[position_hash] = normalize_fen(fen) if fen else None
+                occurrences.append(PositionOccurrence(position_id=position_hash, game_id=game_id, ply=move_number))
+
+            # Pojave koje su već prenesene (prekid između commita i checkpointa, ručni --start-id) se preskaču
+            existing = set(
+                PositionOccurrence.objects
+                .filter(game_id__in={occurrence.game_id for occurrence in occurrences})
+                .values_list('position_id', 'game_id', 'ply')
+            )
+            occurrences = [
+                occurrence for occurrence in occurrences
+                if (occurrence.position_id, occurrence.game_id, occurrence.ply) not in existing
+            ]
+
+            with transaction.atomic():
+                Position.objects.bulk_create(
+                    [Position(id=position_hash, fen=fen) for position_hash, fen in sorted(positions.items())],
+                    batch_size=1000,
+                    ignore_conflicts=True,
+                )
+                PositionOccurrence.objects.bulk_create(occurrences, batch_size=1000)
+                if options['delete']:
+                    FENPosition.objects.filter(id__gt=last_id, id__lte=batch[-1][0]).delete()
+
+            last_id = batch[-1][0]
+            cache.set(CHECKPOINT_KEY, last_id, timeout=None)
+            # Nove pojave mijenjaju liste partija po poziciji
+            bump_generation()
+            migrated += len(occurrences)
+            self.stdout.write(f"{migrated} occurrences migrated (last FENPosition id {last_id})")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {migrated} occurrences migrated."))
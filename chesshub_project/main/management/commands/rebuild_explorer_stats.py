@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from main.bulk_loader import move_stats, unique_positions, upsert_move_stats
+from main.models import Game, Position, PositionMoveStats
+from main.pgn_utils import parse_pgn_game
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the opening explorer aggregate (PositionMoveStats) from the notation of stored games."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--start-id', type=int, default=0, help="Resume after this Game id without clearing the table.")
+
+    def handle(self, *args, **options):
+        last_id = options['start_id']
+        if not last_id:
+            PositionMoveStats.objects.all().delete()
+
+        processed = 0
+        while True:
+            games = list(Game.objects.filter(id__gt=last_id).order_by('id')[:options['batch_size']])
+            if not games:
+                break
+
+            parsed_games = []
+            for game in games:
+                parsed = parse_pgn_game(game.notation or '')
+                if parsed is not None:
+                    parsed_games.append((game, parsed[1]))
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                Position.objects.bulk_create(
+                    [Position(id=position_hash, fen=fen) for position_hash, fen in unique_positions(parsed_games)],
+                    batch_size=1000,
+                    ignore_conflicts=True,
+                )
+                upsert_move_stats(cursor, move_stats(parsed_games))
+
+            last_id = games[-1].id
+            processed += len(games)
+            self.stdout.write(f"{processed} games processed (last Game id {last_id})")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {processed} games processed."))
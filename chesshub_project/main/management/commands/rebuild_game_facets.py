@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.game_queries import aggregate_facets
+from main.models import Game, GameFacetCount
+
+
+class Command(BaseCommand):
+    help = "Recomputes the game facet summary (GameFacetCount) from the Game table."
+
+    def handle(self, *args, **options):
+        facets = aggregate_facets(Game.objects.all())
+
+        with transaction.atomic():
+            GameFacetCount.objects.all().delete()
+            GameFacetCount.objects.bulk_create([
+                GameFacetCount(facet=facet, value=item['value'], games=item['games'])
+                for facet, items in facets.items()
+                for item in items
+            ])
+
+        rows = sum(len(items) for items in facets.values())
+        self.stdout.write(self.style.SUCCESS(f"Done, {rows} facet rows written."))
@@ -37,18 +37,90 @@ class Game(models.Model):
             models.Index(fields=['white_elo', 'black_elo']),
             models.Index(fields=['result']),
             models.Index(fields=['eco']),
+            # Keyset paginacija liste partija: (date, id) u oba smjera, NULL datumi na kraju
+            models.Index(models.F('date').desc(nulls_last=True), models.F('id').desc(), name='game_date_id_desc'),
+            models.Index(models.F('date').asc(nulls_last=True), models.F('id').asc(), name='game_date_id_asc'),
         ]
         ordering = ['-date']
 
+class Position(models.Model):
+    # Primarni ključ je Zobrist hash pozicije (main.pgn_utils.position_hash)
+    id = models.BigIntegerField(primary_key=True)
+    fen = models.CharField(max_length=100, blank=True, null=True)
+    # Evaluacija modela (bez povijesti) i najbolji potez; puni ih annotate_positions u praznom hodu
+    eval = models.FloatField(blank=True, null=True)
+    best_move = models.CharField(max_length=5, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(eval__isnull=True), name='position_unevaluated'),
+        ]
+
+    def __str__(self):
+        return f"Position: {self.fen}"
+
+
+class PositionOccurrence(models.Model):
+    position = models.ForeignKey(Position, on_delete=models.CASCADE, db_index=False)
+    game = models.ForeignKey(Game, on_delete=models.CASCADE)
+    ply = models.SmallIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['position', 'game']),
+        ]
+
+    def __str__(self):
+        return f"{self.position_id} - Game: {self.game_id} - Ply: {self.ply}"
+
+
+class PositionMoveStats(models.Model):
+    # Agregat za opening explorer: jedan red po (pozicija, sljedeći potez), puni se pri unosu partija
+    position = models.ForeignKey(Position, on_delete=models.CASCADE, db_index=False)
+    move = models.CharField(max_length=5)
+    games = models.IntegerField(default=0)
+    white_wins = models.IntegerField(default=0)
+    draws = models.IntegerField(default=0)
+    black_wins = models.IntegerField(default=0)
+    elo_sum = models.BigIntegerField(default=0)
+    elo_games = models.IntegerField(default=0)
+    last_played = models.DateField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['position', 'move'], name='unique_position_move'),
+        ]
+
+    def __str__(self):
+        return f"{self.position_id} {self.move}: {self.games} games"
+
+
+class GameFacetCount(models.Model):
+    # Sažetak za facete liste partija (rezultat, ECO skupina, Elo razred, godina), puni se pri unosu partija
+    facet = models.CharField(max_length=16)
+    value = models.CharField(max_length=32)
+    games = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='unique_facet_value'),
+        ]
+
+    def __str__(self):
+        return f"{self.facet}={self.value}: {self.games} games"
+
+
+# Stara tablica s redom po svakoj pojavi pozicije; nove partije idu u Position/PositionOccurrence
 class FENPosition(models.Model):
-    fen_string = models.CharField(max_length=100, db_index=True)
+    fen_string = models.CharField(max_length=100, blank=True, null=True)
+    position_hash = models.BigIntegerField(blank=True, null=True)
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
     move_number = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         indexes = [
-            models.Index(fields=['fen_string']),
+            models.Index(fields=['position_hash']),
             models.Index(fields=['game']),
         ]
 
@@ -56,6 +128,28 @@ class FENPosition(models.Model):
         return f"FEN: {self.fen_string} - Move: {self.move_number}"
 
 
+class GameAnalysis(models.Model):
+    # Evaluacija svake pozicije partije (ply 0 = početna pozicija), računa se jednom u analyse_game
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, related_name='analysis')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    model_version = models.CharField(max_length=100, blank=True, default="")
+    evals = models.JSONField(default=list)
+    best_moves = models.JSONField(default=list)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Analysis of game {self.game_id} ({self.status})"
+
+
 class PGNFile(models.Model):
     file = models.FileField(upload_to='pgn_files/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
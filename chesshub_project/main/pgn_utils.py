@@ -0,0 +1,196 @@
+import io
+import logging
+import re
+from datetime import datetime
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+logger = logging.getLogger(__name__)
+
+PGN_ENCODING = 'ISO-8859-1'
+
+RESULT_TOKENS = {'1-0', '0-1', '1/2-1/2', '*'}
+TAG_REGEX = re.compile(r'^\[([A-Za-z0-9][A-Za-z0-9_+#=:-]*)\s+"([^\r]*)"\]\s*$')
+
+
+def parse_tag_pair(line):
+    match = TAG_REGEX.match(line)
+    if match:
+        return match.group(1), match.group(2)
+    return None
+
+
+def _comment_state(line, in_comment):
+    # Prati je li kraj linije unutar { } komentara, da '[' u komentaru ne bi započeo novu partiju
+    if in_comment:
+        close_index = line.find('}')
+        if close_index < 0:
+            return True
+        line = line[close_index + 1:]
+
+    semicolon = line.find(';')
+    if semicolon >= 0:
+        brace = line.find('{')
+        if brace < 0 or semicolon < brace:
+            line = line[:semicolon]
+
+    return line.rfind('{') > line.rfind('}')
+
+
+def iter_raw_games(pgn_stream, offset=0):
+    """
+    Splits a PGN text stream into games without building move trees.
+
+    Yields ``(headers, pgn_text, start, end)`` where ``start``/``end`` are
+    character offsets relative to ``offset`` (byte offsets for single-byte
+    encodings such as ISO-8859-1 when the stream is opened with ``newline=''``).
+    """
+    headers = {}
+    lines = []
+    in_movetext = False
+    in_comment = False
+    ends_with_result = False
+    game_over = False
+    start = position = offset
+
+    for line in iter(pgn_stream.readline, ''):
+        line_start = position
+        position += len(line)
+
+        if game_over and not line.isspace() and not line.startswith(('[', '%')):
+            # Partija bez zaglavlja: prazna linija nakon rezultata završava prethodnu partiju
+            yield headers, ''.join(lines), start, line_start
+            headers = {}
+            lines = []
+            in_movetext = False
+            ends_with_result = game_over = False
+
+        if not in_comment and line.startswith('['):
+            ends_with_result = game_over = False
+            if in_movetext:
+                yield headers, ''.join(lines), start, line_start
+                headers = {}
+                lines = []
+                in_movetext = False
+
+            if not lines:
+                start = line_start
+
+            tag = parse_tag_pair(line)
+            if tag:
+                headers[tag[0]] = tag[1]
+            lines.append(line)
+            continue
+
+        if not lines:
+            # Prazne linije i komentari prije prve partije
+            if line.isspace() or line.startswith('%'):
+                start = position
+                continue
+            start = line_start
+
+        lines.append(line)
+
+        if line.isspace():
+            game_over = in_movetext and ends_with_result
+            continue
+        if line.startswith('%'):
+            continue
+
+        in_movetext = True
+        in_comment = _comment_state(line, in_comment)
+        ends_with_result = not in_comment and line.split()[-1] in RESULT_TOKENS
+
+    if lines and (headers or in_movetext):
+        yield headers, ''.join(lines), start, position
+
+
+def position_hash(board):
+    # Zobrist (polyglot) ključ: figure, strana na potezu, rokade i en passant; brojači poteza se ignoriraju kao u sanitize_fen
+    key = chess.polyglot.zobrist_hash(board)
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+def normalize_fen(fen):
+    return ' '.join(fen.split()[:4])
+
+
+def fen_hash(fen):
+    return position_hash(chess.Board(fen))
+
+
+def parse_date(date_string):
+    if not date_string or date_string == "?":
+        return None
+    try:
+        return datetime.strptime(date_string, "%Y.%m.%d").date()
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(date_string, "%Y-%m-%d").date()
+    except ValueError:
+        pass
+    return None
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def game_fields_from_headers(headers, notation):
+    return {
+        "site": headers.get("Site", ""),
+        "date": parse_date(headers.get("Date", "")),
+        "event_date": parse_date(headers.get("EventDate", "")),
+        "round": headers.get("Round", ""),
+        "white_player": headers.get("White", ""),
+        "black_player": headers.get("Black", ""),
+        "result": headers.get("Result", ""),
+        "white_elo": parse_int(headers.get("WhiteElo")) or 0,
+        "black_elo": parse_int(headers.get("BlackElo")) or 0,
+        "white_title": headers.get("WhiteTitle") or None,
+        "black_title": headers.get("BlackTitle") or None,
+        "white_FideId": parse_int(headers.get("WhiteFideId")),
+        "black_FideId": parse_int(headers.get("BlackFideId")),
+        "eco": headers.get("ECO") or None,
+        "notation": notation.strip(),
+    }
+
+
+def parse_pgn_game(pgn_text):
+    # Vraća (polja za Game, [(hash, FEN, odigrani potez u UCI)] glavne varijante) ili None za partije koje se preskaču
+    game = chess.pgn.read_game(io.StringIO(pgn_text))
+    if game is None:
+        return None
+
+    if game.headers.get("Variant", "") == "Chess960":
+        logger.info("Skipping Chess960 game.")
+        return None
+
+    exporter = chess.pgn.StringExporter(headers=True, variations=False, comments=False)
+    notation = game.accept(exporter)
+
+    board = chess.Board()
+    positions = []
+
+    for move in game.mainline_moves():
+        try:
+            if board.is_legal(move):
+                key, fen = position_hash(board), board.fen()
+                board.push(move)
+            else:
+                logger.warning(f"Illegal move {move}, skipping game.")
+                break
+        except AssertionError as e:
+            logger.error(f"Error applying move {move}: {e}")
+            break
+
+        positions.append((key, fen, move.uci()))
+
+    positions.append((position_hash(board), board.fen(), None))
+    return game_fields_from_headers(game.headers, notation), positions
@@ -0,0 +1,122 @@
+import contextlib
+import io
+import os
+import sys
+import time
+from unittest import mock
+from urllib.parse import urlsplit
+
+import redis
+
+from initialize_django import setup_django
+
+setup_django()
+
+from django.conf import settings
+from django.db import transaction
+
+import main.bulk_loader
+import main.utils
+from main.helper import sanitize_fen
+from main.models import Game, FENPosition
+from main.pgn_utils import PGN_ENCODING, iter_raw_games
+from main.tasks import parse_pgn_games, store_parsed_games
+
+CHUNK_SIZES = [15, 50, 100, 250, 500, 1000]
+
+# Rollback vraća samo PostgreSQL, pa pos:*/fen:* zapisi idu u zasebnu Redis bazu koja se prazni nakon svakog mjerenja
+# (baza iz putanje URL-a ima prednost pred db argumentom, pa se zamjenjuje putanja)
+SCRATCH_REDIS_DB = int(os.getenv('BENCHMARK_REDIS_DB', 15))
+scratch_redis = redis.Redis.from_url(urlsplit(settings.REDIS_URL)._replace(path=f'/{SCRATCH_REDIS_DB}').geturl())
+
+
+class Rollback(Exception):
+    pass
+
+
+def cache_fen_position(fen, game_id):
+    # Stari main.utils.cache_fen_position, zadržan samo kao mjerilo
+    sanitized_fen = sanitize_fen(fen)
+    redis_key = f"fen:{sanitized_fen}"
+    scratch_redis.sadd(redis_key, game_id)
+
+    scratch_redis.expire(redis_key, 86400)
+
+    print(f"Added game ID {game_id} to FEN {sanitized_fen}")
+
+
+def legacy_store(parsed_games):
+    # Stari put iz process_pgn_chunk: re-linking O(partije x pozicije) i SADD + EXPIRE po poziciji
+    new_games = [game for game, _ in parsed_games]
+    new_fen_positions = [
+        FENPosition(fen_string=fen, game=game, move_number=move_number)
+        for game, positions in parsed_games
+        for move_number, (_, fen, _) in enumerate(positions)
+    ]
+
+    with transaction.atomic():
+        saved_games = Game.objects.bulk_create(new_games, batch_size=500)
+
+        for idx, game_instance in enumerate(saved_games):
+            for fen_pos in new_fen_positions:
+                if fen_pos.game == new_games[idx]:
+                    fen_pos.game = game_instance
+                    sanitized_fen = sanitize_fen(fen_pos.fen_string)
+                    cache_fen_position(sanitized_fen, game_instance.id)
+
+        FENPosition.objects.bulk_create(new_fen_positions, batch_size=500)
+
+
+def timed(store, games):
+    # Svaki mjereni chunk se vraća (rollback) da baza ostane netaknuta; Redis indeks i generacija liste se ne diraju
+    parsed_games = parse_pgn_games(games)
+    started = time.perf_counter()
+    try:
+        with transaction.atomic(), contextlib.redirect_stdout(io.StringIO()), \
+                mock.patch.object(main.utils, 'redis_client', scratch_redis), \
+                mock.patch.object(main.bulk_loader, 'bump_generation', lambda: None):
+            store(parsed_games)
+            raise Rollback()
+    except Rollback:
+        pass
+    finally:
+        elapsed = time.perf_counter() - started
+        scratch_redis.flushdb()
+    return elapsed
+
+
+def load_games(pgn_file_path, limit):
+    games = []
+    with open(pgn_file_path, "r", encoding=PGN_ENCODING, newline="") as pgn_file:
+        for headers, pgn_text, _, _ in iter_raw_games(pgn_file):
+            if headers.get("Variant", "") == "Chess960":
+                continue
+            games.append(pgn_text)
+            if len(games) == limit:
+                break
+    return games
+
+
+def run(pgn_file_path):
+    scratch_db = scratch_redis.connection_pool.connection_kwargs.get('db', 0)
+    if main.utils.redis_client.connection_pool.connection_kwargs.get('db', 0) == scratch_db:
+        print(f"Redis baza {scratch_db} je živi indeks, postavite drugu BENCHMARK_REDIS_DB.")
+        return
+
+    games = load_games(pgn_file_path, max(CHUNK_SIZES))
+
+    print(f"{'chunk':>6} {'before (ms)':>12} {'after (ms)':>12} {'speedup':>8}")
+    for chunk_size in CHUNK_SIZES:
+        if chunk_size > len(games):
+            break
+        chunk = games[:chunk_size]
+        before = timed(legacy_store, chunk)
+        after = timed(store_parsed_games, chunk)
+        print(f"{chunk_size:>6} {before * 1000:>12.1f} {after * 1000:>12.1f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Koristite: python benchmark_chunk_persistence.py <pgn_file_path>")
+    else:
+        run(sys.argv[1])
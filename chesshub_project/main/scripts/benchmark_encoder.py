@@ -0,0 +1,59 @@
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import chess
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../")))
+
+from main.chess_model.auxiliary_func import board_to_matrix, encode_boards
+
+BATCH_SIZES = [1, 8, 32, 128]
+
+
+def random_positions(count, seed=0):
+    # Nasumične partije; svaka pozicija dobiva zadnjih 8 ploča povijesti kao u evaluate_fen
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = chess.Board()
+        history = []
+        for _ in range(rng.randint(1, 120)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            history.append(board.copy(stack=False))
+            board.push(rng.choice(moves))
+        counter = Counter(b.board_fen() for b in history + [board])
+        positions.append((board, history[-8:], counter))
+    return positions
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def run(count=512, repeat=5):
+    positions = random_positions(count)
+
+    tensors, metas = encode_boards(positions)
+    for i, position in enumerate(positions):
+        tensor, meta = board_to_matrix(*position)
+        assert tensor.tobytes() == tensors[i].tobytes() and meta.tobytes() == metas[i].tobytes(), f"Mismatch at {i}"
+    print(f"Output identical for {count} positions.")
+
+    print(f"{'batch':>6} {'loop (us/pos)':>14} {'vectorized (us/pos)':>20} {'speedup':>8}")
+    for batch_size in BATCH_SIZES:
+        batches = [positions[i:i + batch_size] for i in range(0, count, batch_size)]
+        before = timed(lambda: [board_to_matrix(*position) for position in positions], repeat)
+        after = timed(lambda: [encode_boards(batch) for batch in batches], repeat)
+        print(f"{batch_size:>6} {before * 1e6 / count:>14.1f} {after * 1e6 / count:>20.1f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    run(*(int(arg) for arg in sys.argv[1:3]))
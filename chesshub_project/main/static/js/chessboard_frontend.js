@@ -385,15 +385,18 @@ function hideLoader() {
     document.body.style.pointerEvents = "auto";
 }
 
-async function fetchGames(page = 1) {
+async function fetchGames(page = 1, cursor = null) {
     showLoader();
 
     let queryParams = new URLSearchParams(filters);
     queryParams.append('page', page);
+    if (cursor) {
+        queryParams.append('cursor', cursor);
+    }
 
     const endpoint = Object.keys(filters).length > 0 ? 
         `/filtered_games/?${queryParams.toString()}` : 
-        `/get_games/?page=${page}`;
+        `/get_games/?page=${page}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`;
 
 
     try {
@@ -401,7 +404,7 @@ async function fetchGames(page = 1) {
         const data = await response.json();
 
         renderGames(data.games);
-        setupPagination(data.total_pages, data.current_page);
+        setupPagination(data.total_pages, data.current_page, false, data.next_cursor);
 
     } catch (error) {
         console.error("Error fetching games:", error);
@@ -440,7 +443,7 @@ function renderGames(games) {
     });
 }
 
-function setupPagination(totalPages, currentPage, isFenSearch = false) {
+function setupPagination(totalPages, currentPage, isFenSearch = false, nextCursor = null) {
     const pagination = document.querySelector('#pagination');
     pagination.innerHTML = ''; 
 
@@ -508,10 +511,11 @@ function setupPagination(totalPages, currentPage, isFenSearch = false) {
     nextButton.innerHTML = `<a class="page-link" href="#" aria-label="Next">&raquo;</a>`;
     nextButton.addEventListener('click', () => {
         if (currentPage < totalPages) {
+            // Sljedeća stranica ide preko kursora, bez OFFSET-a na serveru
             if (isFenSearch) {
-                fetchGamesByFEN(window.currentFen, currentPage + 1);
+                fetchGamesByFEN(window.currentFen, currentPage + 1, nextCursor);
             } else {
-                fetchGames(currentPage + 1);
+                fetchGames(currentPage + 1, nextCursor);
             }
         }
     });
@@ -537,7 +541,7 @@ document.getElementById('filter-form').addEventListener('submit', function(event
         console.log("Fetching games by FEN due to active position:", window.currentFen);
         fetchGamesByFEN(window.currentFen, 1);
     } else {
-        fetchGames(1, true);
+        fetchGames(1);
     }
 });
 
@@ -686,12 +690,15 @@ document.getElementById("reset-game").addEventListener("click", function() {
       });
 });
 
-async function fetchGamesByFEN(fen, page = 1) {
+async function fetchGamesByFEN(fen, page = 1, cursor = null) {
     showLoader();
 
     let queryParams = new URLSearchParams(filters);
     queryParams.append('fen', fen);
     queryParams.append('page', page);
+    if (cursor) {
+        queryParams.append('cursor', cursor);
+    }
 
     const endpoint = `/get_games_by_fen/?${queryParams.toString()}`;
 
@@ -713,7 +720,7 @@ async function fetchGamesByFEN(fen, page = 1) {
         }
 
         renderGames(data.games);
-        setupPagination(data.total_pages, data.current_page, true);
+        setupPagination(data.total_pages, data.current_page, true, data.next_cursor);
         console.log(`Fetched ${data.games.length} games for FEN:`, fen);
 
     } catch (error) {
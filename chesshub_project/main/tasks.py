@@ -1,79 +1,38 @@
 import logging
 from celery import shared_task
 import redis
-from datetime import datetime
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
-import chess.pgn
 import io
+import time
+
+import chess.pgn
 
-from .models import Game, FENPosition
-from .utils import cache_fen_position
-from .helper import sanitize_fen
+from .models import Game, Position, PositionOccurrence
+from .utils import cache_position_games, position_key, position_empty_key, position_warming_key
+from .pgn_utils import PGN_ENCODING, iter_raw_games, parse_pgn_game
+from .bulk_loader import get_bulk_loader
 
 from django.core.cache import cache
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile # LOKALNI STORAGE
 from django.conf import settings
-from django.db import transaction
 
 logger = logging.getLogger(__name__)
 redis_client = redis.Redis.from_url(settings.REDIS_URL)
 
-def parse_date(date_string):
-    if not date_string or date_string == "?":
-        return None
-    try:
-        return datetime.strptime(date_string, "%Y.%m.%d").date()
-    except ValueError:
-        pass
-    try:
-        return datetime.strptime(date_string, "%Y-%m-%d").date()
-    except ValueError:
-        pass
-    return None
-
-def update_cache_with_games(games):
-    page_size = 100
-    total_games = Game.objects.count()
-    total_pages = (total_games // page_size) + (1 if total_games % page_size else 0)
-
-    last_page_key = f'games_page_{total_pages}'
-    last_page_data = cache.get(last_page_key, {'games': [], 'total_pages': total_pages, 'current_page': total_pages})
-
-    if len(last_page_data['games']) + len(games) > page_size:
-        total_pages += 1
-        new_page_key = f'games_page_{total_pages}'
-        cache.set(new_page_key, {'games': games, 'total_pages': total_pages, 'current_page': total_pages}, timeout=1200)
-    else:
-        last_page_data['games'].extend(games)
-        cache.set(last_page_key, last_page_data, timeout=1200)
-
-    first_page_key = "games_page_1"
-    first_page_data = cache.get(first_page_key)
-    if first_page_data:
-        first_page_data['total_pages'] = total_pages  
-        cache.set(first_page_key, first_page_data, timeout=1200)
-
-    cache.set('games_total_pages', total_pages, timeout=1200)
-    logger.info(f"Cache updated with {len(games)} new games on page {total_pages}")
-
 def broadcast_games(processed_games):
     channel_layer = get_channel_layer()
-    total_pages_key = 'games_total_pages'
-    total_pages = cache.get(total_pages_key, 1)
-    last_page_data = cache.get(f'games_page_{total_pages}', {"games": [], "current_page": total_pages})
 
     async_to_sync(channel_layer.group_send)(
         "games_group",
         {
             "type": "send_game_update",
-            "data": last_page_data["games"]
+            "data": processed_games
         }
     )
 
-    logger.info(f"Broadcasting {len(last_page_data['games'])} new games to clients on page {total_pages}")
+    logger.info(f"Broadcasting {len(processed_games)} new games to clients")
 
 @shared_task(queue='upload_queue')
 def upload_pgn_to_storage(pgn_file_path):
@@ -110,148 +69,242 @@ def fetch_pgn_files_from_storage():
         logger.error(f"Error fetching PGN files: {str(e)}")
 
 
+def ingest_progress_key(pgn_file_path):
+    return f'pgn_progress:{pgn_file_path}'
+
+def pending_chunks_key(pgn_file_path):
+    return f'pgn_pending_chunks:{pgn_file_path}'
+
+def dispatch_lock_key(pgn_file_path):
+    return f'pgn_dispatch_lock:{pgn_file_path}'
+
+def done_chunks_key(pgn_file_path):
+    return f'pgn_done_chunks:{pgn_file_path}'
+
+def ingest_activity_key(pgn_file_path):
+    return f'pgn_activity:{pgn_file_path}'
+
+def touch_ingest_activity(pgn_file_path):
+    cache.set(ingest_activity_key(pgn_file_path), time.time(), timeout=None)
+
+def ingest_is_stale(pgn_file_path):
+    # Nijedan chunk datoteke nije ni poslan ni završen unutar PGN_CHUNK_STALE_TIMEOUT, pa je neki izgubljen
+    last_activity = cache.get(ingest_activity_key(pgn_file_path))
+    if last_activity is None:
+        touch_ingest_activity(pgn_file_path)
+        return False
+    return time.time() - last_activity > settings.PGN_CHUNK_STALE_TIMEOUT
+
+def get_ingest_progress(pgn_file_path):
+    return cache.get(ingest_progress_key(pgn_file_path), {'offset': 0, 'games_dispatched': 0, 'chunks_dispatched': 0, 'done': False})
+
+def save_ingest_progress(pgn_file_path, offset, games_dispatched, chunks_dispatched, done=False):
+    # ISO-8859-1 je jednobajtno kodiranje, pa su offseti iz iter_raw_games ujedno i bajtni offseti
+    cache.set(ingest_progress_key(pgn_file_path), {
+        'offset': offset,
+        'games_dispatched': games_dispatched,
+        'chunks_dispatched': chunks_dispatched,
+        'done': done,
+    }, timeout=None)
+    cache.touch(dispatch_lock_key(pgn_file_path), settings.PGN_DISPATCH_LOCK_TIMEOUT)
+    touch_ingest_activity(pgn_file_path)
+
+def clear_ingest_progress(pgn_file_path):
+    cache.delete_many([ingest_progress_key(pgn_file_path), pending_chunks_key(pgn_file_path),
+                       ingest_activity_key(pgn_file_path)])
+    redis_client.delete(done_chunks_key(pgn_file_path))
+
+def release_pgn_file(pgn_file_path):
+    # Datoteka se premješta tek kad je obrađen zadnji chunk koji iz nje čita
+    try:
+        pending = cache.decr(pending_chunks_key(pgn_file_path))
+    except ValueError:
+        logger.warning(f"Pending chunk counter missing for {pgn_file_path}, leaving file in place.")
+        return
+
+    touch_ingest_activity(pgn_file_path)
+    if pending <= 0:
+        clear_ingest_progress(pgn_file_path)
+        move_processed_pgn_file(pgn_file_path)
+
+def new_chunk(pgn_file_path, index):
+    # Granice chunkova ovise samo o datoteci i postavkama, pa isti index pri ponovnom slanju znači iste partije
+    return {'path': pgn_file_path, 'index': index, 'ranges': [], 'games': 0, 'bytes': 0}
+
+def add_game_to_chunk(chunk, start, end):
+    ranges = chunk['ranges']
+    if ranges and ranges[-1][1] == start:
+        ranges[-1][1] = end
+    else:
+        ranges.append([start, end])
+    chunk['games'] += 1
+    chunk['bytes'] += end - start
+
+def chunk_is_full(chunk):
+    return (chunk['games'] >= settings.PGN_CHUNK_MAX_GAMES
+            or chunk['bytes'] >= settings.PGN_CHUNK_TARGET_BYTES)
+
+def read_pgn_chunk(chunk):
+    games = []
+    with default_storage.open(chunk['path'], 'rb') as pgn_file:
+        for start, end in chunk['ranges']:
+            pgn_file.seek(start)
+            data = pgn_file.read(end - start).decode(PGN_ENCODING)
+            games.extend(pgn_text for _, pgn_text, _, _ in iter_raw_games(io.StringIO(data)))
+    return games
+
 @shared_task(queue='process_queue')
 def process_pgn_queue(pgn_file_path):
     logger.info(f"Processing PGN file with path: {pgn_file_path}")
 
     try:
         corrected_path = pgn_file_path.replace("pgn_uploads/pgn_uploads/", "pgn_uploads/")
-        with default_storage.open(corrected_path, 'rb') as pgn_file:
-            pgn_content = pgn_file.read().decode('ISO-8859-1')
         logger.info(f"Processing corrected PGN path: {corrected_path}")
 
-        pgn_io = io.StringIO(pgn_content)
-        games = []
-        chunk_size = 15
-        chunk_count = 0
+        progress = get_ingest_progress(corrected_path)
+        if progress['done']:
+            if not ingest_is_stale(corrected_path):
+                logger.info(f"{corrected_path} already dispatched, waiting for its chunks to finish.")
+                return
+            # Izgubljeni chunk bi brojač ostavio iznad nule zauvijek; završeni chunkovi se preskaču po indeksu
+            logger.warning(f"No chunk of {corrected_path} finished in {settings.PGN_CHUNK_STALE_TIMEOUT}s, re-dispatching unfinished chunks.")
+            cache.delete(ingest_progress_key(corrected_path))
+            progress = get_ingest_progress(corrected_path)
+
+        if not cache.add(dispatch_lock_key(corrected_path), 1, timeout=settings.PGN_DISPATCH_LOCK_TIMEOUT):
+            logger.info(f"{corrected_path} is already being dispatched, skipping.")
+            return
+
+        games_dispatched = progress['games_dispatched']
+        chunk_count = progress['chunks_dispatched']
+        if progress['offset']:
+            logger.info(f"Resuming {corrected_path} at byte {progress['offset']} ({games_dispatched} games already dispatched)")
+            cache.add(pending_chunks_key(corrected_path), 1, timeout=None)
+        else:
+            # Jedan "token" drži dispatcher dok ne završi, da zadnji chunk ne premjesti datoteku prerano
+            cache.set(pending_chunks_key(corrected_path), 1, timeout=None)
+
+        done_chunks = {int(index) for index in redis_client.smembers(done_chunks_key(corrected_path))}
+        chunk = new_chunk(corrected_path, chunk_count)
+        end = progress['offset']
 
-        while True:
-            game = chess.pgn.read_game(pgn_io)
-            if game is None:
-                break
-
-            if game.headers.get("Variant", "") == "Chess960":
-                logger.info("Skipping Chess960 game.")
-                continue  
-
-            exporter = chess.pgn.StringExporter(headers=True, variations=False, comments=False)
-            notation = game.accept(exporter)
-            games.append(notation)
-
-            if len(games) == chunk_size:
-                logger.info(f"Sending chunk {chunk_count + 1} to processing queue")
-                process_pgn_chunk.apply_async(args=[games])
-                games = []
+        with default_storage.open(corrected_path, 'rb') as pgn_file:
+            pgn_io = io.TextIOWrapper(pgn_file, encoding=PGN_ENCODING, newline='')
+            pgn_io.seek(progress['offset'])
+
+            for headers, pgn_text, start, end in iter_raw_games(pgn_io, progress['offset']):
+                if headers.get("Variant", "") == "Chess960":
+                    logger.info("Skipping Chess960 game.")
+                    continue
+
+                add_game_to_chunk(chunk, start, end)
+
+                if chunk_is_full(chunk):
+                    dispatch_chunk(chunk, done_chunks)
+                    games_dispatched += chunk['games']
+                    chunk_count += 1
+                    chunk = new_chunk(corrected_path, chunk_count)
+                    save_ingest_progress(corrected_path, end, games_dispatched, chunk_count)
+
+            if chunk['games']:
+                logger.info("Sending final chunk to processing queue")
+                dispatch_chunk(chunk, done_chunks)
+                games_dispatched += chunk['games']
                 chunk_count += 1
 
-        if games:
-            logger.info("Sending final chunk to processing queue")
-            process_pgn_chunk.apply_async(args=[games])
-            chunk_count += 1
-
-        logger.info(f"Total {chunk_count} chunks submitted for processing")
+        logger.info(f"Total {chunk_count} chunks ({games_dispatched} games) submitted for processing")
 
-        move_processed_pgn_file(corrected_path)
+        save_ingest_progress(corrected_path, end, games_dispatched, chunk_count, done=True)
+        cache.delete(dispatch_lock_key(corrected_path))
+        release_pgn_file(corrected_path)
 
     except Exception as e:
         logger.error(f"Error processing PGN file: {str(e)}")
+        cache.delete(dispatch_lock_key(corrected_path))
         
-@shared_task(queue='chunk_queue')
-def process_pgn_chunk(games):
-    logger.info(f"Processing chunk of {len(games)} games...")
+def dispatch_chunk(chunk, done_chunks):
+    if chunk['index'] in done_chunks:
+        logger.info(f"Chunk {chunk['index'] + 1} of {chunk['path']} already processed, skipping.")
+        return
+    logger.info(f"Sending chunk {chunk['index'] + 1} ({chunk['games']} games, {chunk['bytes']} bytes) to processing queue")
+    cache.incr(pending_chunks_key(chunk['path']))
+    process_pgn_chunk.apply_async(args=[chunk])
+
+# acks_late: poruka se potvrđuje tek nakon obrade, pa chunk s palog workera broker ponovno isporuči
+@shared_task(bind=True, queue='chunk_queue', acks_late=True, reject_on_worker_lost=True,
+             max_retries=3, default_retry_delay=30)
+def process_pgn_chunk(self, chunk):
+    # chunk je referenca {'path', 'ranges'} na uploadanu datoteku; lista PGN stringova je stari format poruke
+    if not isinstance(chunk, dict):
+        return process_pgn_games(chunk)
+
+    # Već upisan chunk (ponovna isporuka ili ponovno slanje sporog chunka) ne otpušta token drugi put;
+    # ako brojač zbog toga ostane iznad nule, sljedeći oporavak ga postavlja iznova
+    if chunk.get('index') is not None and redis_client.sismember(done_chunks_key(chunk['path']), chunk['index']):
+        return f"Chunk {chunk['index'] + 1} of {chunk['path']} already processed."
+
+    try:
+        result = process_pgn_games(read_pgn_chunk(chunk))
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e)
+        logger.error(f"Giving up on chunk {chunk.get('index')} of {chunk['path']}: {str(e)}")
+        release_pgn_file(chunk['path'])
+        raise
 
-    games_added = 0
-    processed_games = []
-    new_games = []
-    new_fen_positions = []
+    if chunk.get('index') is not None:
+        redis_client.sadd(done_chunks_key(chunk['path']), chunk['index'])
+    release_pgn_file(chunk['path'])
+    return result
+
+
+def parse_pgn_games(games):
+    parsed_games = []
 
     for pgn in games:
-        pgn_io = io.StringIO(pgn)
-        game = chess.pgn.read_game(pgn_io)
-
-        if game.headers.get("Variant", "") == "Chess960":
-            logger.info("Skipping Chess960 game.")
-            continue  
-
-        game_instance = Game(
-            site=game.headers.get("Site", ""),
-            date=parse_date(game.headers.get("Date", "")),
-            round=game.headers.get("Round", ""),
-            white_player=game.headers.get("White", ""),
-            black_player=game.headers.get("Black", ""),
-            result=game.headers.get("Result", ""),
-            white_elo=int(game.headers.get("WhiteElo", 0) or 0),
-            black_elo=int(game.headers.get("BlackElo", 0) or 0),
-            notation=pgn.strip(),
-        )
-        new_games.append(game_instance)
+        parsed = parse_pgn_game(pgn)
+        if parsed is None:
+            continue
 
-        board = chess.Board()
-        move_count = 0
-        
-        fen = board.fen()
-        new_fen_positions.append(FENPosition(
-            fen_string=fen,
-            game=game_instance,  
-            move_number=move_count
-        ))
-
-        move_count += 1
-
-        for move in game.mainline_moves():
-            try:
-                if board.is_legal(move):
-                    board.push(move)
-                else:
-                    logger.warning(f"Illegal move {move}, skipping game.")
-                    break
-            except AssertionError as e:
-                logger.error(f"Error applying move {move}: {e}")
-                break
+        fields, positions = parsed
+        parsed_games.append((Game(**fields), positions))
 
-            fen = board.fen()
-            new_fen_positions.append(FENPosition(
-                fen_string=fen,
-                game=game_instance,  
-                move_number=move_count
-            ))
+    return parsed_games
 
-            move_count += 1
 
-        games_added += 1
+def store_parsed_games(parsed_games, loader=None):
+    loader = loader or get_bulk_loader()
+    fen_count = loader.write(parsed_games)
 
-        processed_games.append({
-            "white_player": game.headers.get("White", ""),
-            "white_elo": game.headers.get("WhiteElo", 0),
-            "black_player": game.headers.get("Black", ""),
-            "black_elo": game.headers.get("BlackElo", 0),
-            "result": game.headers.get("Result", ""),
-            "date": game.headers.get("Date", ""),
-            "site": game.headers.get("Site", "")
-        })
+    cache_position_games((position_hash, game.id) for game, positions in parsed_games for position_hash, _, _ in positions)
+    return fen_count
 
-    if new_games:
-        with transaction.atomic():
-            saved_games = Game.objects.bulk_create(new_games, batch_size=500)
 
-            for idx, game_instance in enumerate(saved_games):
-                for fen_pos in new_fen_positions:
-                    if fen_pos.game == new_games[idx]:
-                        fen_pos.game = game_instance
-                        sanitized_fen = sanitize_fen(fen_pos.fen_string)
-                        cache_fen_position(sanitized_fen, game_instance.id)
+def process_pgn_games(games):
+    logger.info(f"Processing chunk of {len(games)} games...")
+
+    parsed_games = parse_pgn_games(games)
 
-            FENPosition.objects.bulk_create(new_fen_positions, batch_size=500)
+    if parsed_games:
+        fen_count = store_parsed_games(parsed_games)
 
-        logger.info(f"Stored {games_added} games and {len(new_fen_positions)} FEN positions in database.")
+        logger.info(f"Stored {len(parsed_games)} games and {fen_count} FEN positions in database.")
 
-        sync_fen_to_redis.delay()
+    processed_games = [{
+        "id": game.id,
+        "white_player": game.white_player,
+        "white_elo": game.white_elo,
+        "black_player": game.black_player,
+        "black_elo": game.black_elo,
+        "result": game.result,
+        "date": game.date.strftime("%Y.%m.%d") if game.date else "",
+        "site": game.site
+    } for game, _ in parsed_games]
 
-    update_cache_with_games(processed_games)
     broadcast_games(processed_games)
 
     logger.info(f"Broadcasting {len(processed_games)} new games to clients.")
-    return f'Chunk processed: {games_added} games added and broadcasted.'
+    return f'Chunk processed: {len(parsed_games)} games added and broadcasted.'
 
 
 def move_processed_pgn_file(file_path):
@@ -265,32 +318,242 @@ def move_processed_pgn_file(file_path):
     try:
         new_path = file_path.replace("pgn_uploads", "processed_pgns")
         with default_storage.open(file_path, "rb") as f:
-            content = f.read()
-            default_storage.save(new_path, ContentFile(content))
+            default_storage.save(new_path, f)
         default_storage.delete(file_path)
         logger.info(f"Moved processed file to: {new_path}")
     except Exception as e:
         logger.error(f"Error moving file {file_path} to {new_path}: {str(e)}")
 
+POSITION_INDEX_HWM_KEY = 'pos_index:last_occurrence_id'
+POSITION_INDEX_LOCK_KEY = 'pos_index:sync_lock'
+
+def sync_position_index(last_id):
+    # Poziva se samo dok se drži POSITION_INDEX_LOCK_KEY
+    synced = 0
+    while True:
+        batch = list(
+            PositionOccurrence.objects
+            .filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'position_id', 'game_id')[:settings.POSITION_INDEX_SYNC_BATCH]
+        )
+        if not batch:
+            break
+
+        cache_position_games((position_id, game_id) for _, position_id, game_id in batch)
+        last_id = batch[-1][0]
+        redis_client.set(POSITION_INDEX_HWM_KEY, last_id)
+        redis_client.expire(POSITION_INDEX_LOCK_KEY, settings.POSITION_INDEX_LOCK_TIMEOUT)
+        synced += len(batch)
+
+    if synced:
+        logger.info(f"Synced {synced} position occurrences to Redis (up to id {last_id}).")
+    return synced
+
+
 @shared_task
 def sync_fen_to_redis():
-    all_fen_positions = FENPosition.objects.all()
-    for position in all_fen_positions:
-        sanitized_fen = sanitize_fen(position.fen_string)
-        redis_client.sadd(f"fen:{sanitized_fen}", position.game_id.id)
-    print("Redis FEN cache successfully updated.")
+    # Inkrementalno: samo pojave s id-em većim od zadnjeg sinkroniziranog (high-water mark u Redisu)
+    if not redis_client.set(POSITION_INDEX_LOCK_KEY, 1, nx=True, ex=settings.POSITION_INDEX_LOCK_TIMEOUT):
+        logger.info("Position index sync already running, skipping.")
+        return
+
+    try:
+        return sync_position_index(int(redis_client.get(POSITION_INDEX_HWM_KEY) or 0))
+    finally:
+        redis_client.delete(POSITION_INDEX_LOCK_KEY)
 
 
 @shared_task
-def refresh_fen_cache():
-    logger.info("Starting refresh of FEN cache...")
-    all_fen_positions = FENPosition.objects.all()
-
-    for position in all_fen_positions:
-        sanitized_fen = sanitize_fen(position.fen_string)
-        redis_key = f"fen:{sanitized_fen}"
-        redis_client.sadd(redis_key, position.game_id)
-        redis_client.expire(redis_key, 86400)
-
-    logger.info("Redis FEN cache successfully updated.")
-    return "Redis FEN cache updated."
+def warm_position_index(position_hash):
+    try:
+        game_ids = (
+            PositionOccurrence.objects
+            .filter(position_id=position_hash)
+            .values_list('game_id', flat=True)
+            .iterator(chunk_size=settings.POSITION_INDEX_SYNC_BATCH)
+        )
+
+        warmed = 0
+        batch = []
+        for game_id in game_ids:
+            batch.append((position_hash, game_id))
+            if len(batch) == settings.POSITION_INDEX_SYNC_BATCH:
+                cache_position_games(batch)
+                warmed += len(batch)
+                batch = []
+        cache_position_games(batch)
+        warmed += len(batch)
+
+        if not warmed:
+            redis_client.set(position_empty_key(position_hash), 1, ex=settings.POSITION_NEGATIVE_TTL)
+    finally:
+        redis_client.delete(position_warming_key(position_hash))
+
+    logger.info(f"Warmed Redis position {position_hash} with {warmed} games.")
+
+
+@shared_task(bind=True, max_retries=None, default_retry_delay=30)
+def rebuild_position_index(self):
+    # Zaključavanje prije brisanja, da sinkronizacija iz beata ne piše u indeks koji se upravo briše
+    if not redis_client.set(POSITION_INDEX_LOCK_KEY, 1, nx=True, ex=settings.POSITION_INDEX_LOCK_TIMEOUT):
+        logger.info("Position index sync is running, retrying the rebuild later.")
+        raise self.retry()
+
+    logger.info("Rebuilding Redis position index from scratch...")
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for count, redis_key in enumerate(redis_client.scan_iter(match=position_key('*'), count=1000), start=1):
+            pipe.unlink(redis_key)
+            if count % 1000 == 0:
+                pipe.execute()
+                redis_client.expire(POSITION_INDEX_LOCK_KEY, settings.POSITION_INDEX_LOCK_TIMEOUT)
+        pipe.delete(POSITION_INDEX_HWM_KEY)
+        pipe.execute()
+
+        synced = sync_position_index(0)
+    finally:
+        redis_client.delete(POSITION_INDEX_LOCK_KEY)
+
+    logger.info("Redis position index rebuilt.")
+    return f"Redis position index rebuilt with {synced} occurrences."
+
+
+@shared_task(queue='eval_queue', ignore_result=False)
+def evaluate_position_task(fen, history):
+    # Dretve workera dijele jedan model i servis, pa se istovremeni zahtjevi spajaju u batch
+    from .chess_model.service import get_evaluation_service
+
+    return get_evaluation_service().evaluate(fen, history, timeout=settings.EVAL_TIMEOUT)
+
+
+@shared_task(queue='eval_queue')
+def analyse_game(game_id):
+    from .chess_model.eval_cache import model_version
+    from .chess_model.evaluation import evaluate_game
+    from .models import GameAnalysis
+
+    analysis, _ = GameAnalysis.objects.get_or_create(game_id=game_id)
+    version = model_version()
+    if analysis.status == 'done' and analysis.model_version == version:
+        return f"Game {game_id} is already analysed."
+
+    analysis.status = 'running'
+    analysis.save(update_fields=['status', 'updated_at'])
+
+    try:
+        game = chess.pgn.read_game(io.StringIO(Game.objects.values_list('notation', flat=True).get(id=game_id) or ''))
+        if game is None:
+            raise ValueError("Game has no readable notation.")
+
+        start = time.monotonic()
+        evals, best_moves = evaluate_game(game.mainline_moves(), game.board(), batch_size=settings.ANALYSIS_BATCH_SIZE)
+        elapsed = time.monotonic() - start
+    except Exception as e:
+        logger.error(f"Analysis of game {game_id} failed: {e}")
+        analysis.status = 'failed'
+        analysis.error = str(e)
+        analysis.save(update_fields=['status', 'error', 'updated_at'])
+        return f"Analysis of game {game_id} failed."
+
+    analysis.status = 'done'
+    analysis.model_version = version
+    analysis.evals = evals
+    analysis.best_moves = best_moves
+    analysis.error = ''
+    analysis.save()
+
+    logger.info(f"Analysed game {game_id}: {len(evals)} positions in {elapsed:.2f}s ({len(evals) / max(elapsed, 1e-6):.0f} pos/s).")
+    return f"Analysed {len(evals)} positions of game {game_id}."
+
+
+ANNOTATE_HWM_KEY = 'annotate:last_position'
+ANNOTATE_LOCK_KEY = 'annotate:lock'
+INGESTION_QUEUES = ('upload_queue', 'fetch_queue', 'process_queue', 'chunk_queue')
+
+
+def ingestion_backlog(broker):
+    # Celery redovi su liste u brokeru, koji ne mora biti isti Redis kao REDIS_URL
+    pipe = broker.pipeline(transaction=False)
+    for queue in INGESTION_QUEUES:
+        pipe.llen(queue)
+    return sum(pipe.execute())
+
+
+@shared_task(queue='eval_queue')
+def annotate_positions():
+    """
+    Fills ``Position.eval`` and ``best_move`` for positions without an eval.
+
+    Walks the table in id order from a high-water mark kept in Redis, so an
+    interrupted run continues where it stopped; after a full pass the mark is
+    cleared and the next run picks up positions inserted behind it. A run
+    stops after ``ANNOTATE_MAX_SECONDS`` or as soon as the ingestion queues
+    hold more than ``ANNOTATE_BACKLOG_LIMIT`` messages, and is throttled to
+    ``ANNOTATE_MAX_POSITIONS_PER_SEC``.
+    """
+    if not redis_client.set(ANNOTATE_LOCK_KEY, 1, nx=True, ex=settings.ANNOTATE_LOCK_TIMEOUT):
+        logger.info("Position annotation already running, skipping.")
+        return 0
+
+    from .chess_model.evaluation import evaluate_boards
+
+    broker = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+    batch_size = settings.ANNOTATE_BATCH_SIZE
+    min_batch_seconds = batch_size / settings.ANNOTATE_MAX_POSITIONS_PER_SEC if settings.ANNOTATE_MAX_POSITIONS_PER_SEC else 0
+    start = time.monotonic()
+    annotated = 0
+
+    try:
+        last_id = redis_client.get(ANNOTATE_HWM_KEY)
+        last_id = int(last_id) if last_id is not None else None
+
+        while time.monotonic() - start < settings.ANNOTATE_MAX_SECONDS:
+            backlog = ingestion_backlog(broker)
+            if backlog > settings.ANNOTATE_BACKLOG_LIMIT:
+                logger.info(f"Ingestion backlog of {backlog} messages, pausing position annotation.")
+                break
+
+            batch_start = time.monotonic()
+            # Redovi bez FEN-a (migrate_fen_positions) se preskaču; chess.Board(None) bi dao praznu ploču
+            pending = Position.objects.filter(eval__isnull=True, fen__isnull=False).exclude(fen='')
+            if last_id is not None:
+                pending = pending.filter(id__gt=last_id)
+            positions = list(pending.order_by('id').only('id', 'fen')[:batch_size])
+            if not positions:
+                redis_client.delete(ANNOTATE_HWM_KEY)
+                logger.info("All positions are annotated.")
+                break
+
+            boards = []
+            valid = []
+            for position in positions:
+                # Position.fen nema brojače poteza, chess.Board ih dopuni s 0 1
+                try:
+                    boards.append(chess.Board(position.fen))
+                except ValueError:
+                    logger.warning(f"Skipping position {position.id} with invalid FEN {position.fen!r}")
+                    continue
+                valid.append(position)
+
+            for position, (eval_value, best_move) in zip(valid, evaluate_boards(boards)):
+                position.eval = eval_value
+                position.best_move = best_move
+            Position.objects.bulk_update(valid, ['eval', 'best_move'])
+
+            last_id = positions[-1].id
+            redis_client.set(ANNOTATE_HWM_KEY, last_id)
+            redis_client.expire(ANNOTATE_LOCK_KEY, settings.ANNOTATE_LOCK_TIMEOUT)
+            annotated += len(valid)
+
+            # Ograničenje propusnosti da evaluacija ne uzme sav CPU workera
+            elapsed = time.monotonic() - batch_start
+            if elapsed < min_batch_seconds:
+                time.sleep(min_batch_seconds - elapsed)
+    finally:
+        redis_client.delete(ANNOTATE_LOCK_KEY)
+
+    if annotated:
+        elapsed = time.monotonic() - start
+        logger.info(f"Annotated {annotated} positions in {elapsed:.1f}s ({annotated / elapsed:.0f} pos/s), up to id {last_id}.")
+    return annotated
@@ -18,8 +18,13 @@ urlpatterns = [
     path('task-status/<str:task_id>/', views.check_task_status, name='task_status'),
     path('api/games/', get_games, name='get_games'),
     path('filtered_games/', filtered_games, name='filtered_games'),
+    path('game_facets/', views.game_facets_view, name='game_facets'),
     path('reset_game/', views.reset_game, name='reset_game'),
     path('get_games_by_fen/', views.get_games_by_fen, name='get_games_by_fen'),
+    path('explorer/', views.opening_explorer, name='opening_explorer'),
     path('clear_filters/', views.clear_filters, name='clear_filters'),
-    path("evaluate_fen/", views.evaluate_fen_view, name="evaluate_fen")
+    path("evaluate_fen/", views.evaluate_fen_view, name="evaluate_fen"),
+    path("eval_cache_stats/", views.eval_cache_stats, name="eval_cache_stats"),
+    path("analyse_game/<int:game_id>/", views.analyse_game_view, name="analyse_game"),
+    path("game_analysis/<int:game_id>/", views.game_analysis, name="game_analysis"),
 ]
\ No newline at end of file
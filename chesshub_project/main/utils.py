@@ -1,23 +1,49 @@
 import redis
+from collections import defaultdict
 from django.conf import settings
-from main.helper import sanitize_fen
 from django.core.cache import cache
 
 redis_client = redis.Redis.from_url(settings.REDIS_URL)
 
-def cache_fen_position(fen, game_id):
-    sanitized_fen = sanitize_fen(fen)
-    redis_key = f"fen:{sanitized_fen}"
-    redis_client.sadd(redis_key, game_id)
+def position_key(position_hash):
+    return f"pos:{position_hash}"
 
-    redis_client.expire(redis_key, 86400)
 
-    print(f"Added game ID {game_id} to FEN {sanitized_fen}")
+def position_empty_key(position_hash):
+    return f"pos:{position_hash}:none"
 
 
-def get_games_by_fen(fen):
-    sanitized_fen = sanitize_fen(fen)
-    redis_key = f"fen:{sanitized_fen}"
-    game_ids = redis_client.smembers(redis_key)
+def position_warming_key(position_hash):
+    return f"pos:{position_hash}:warming"
 
-    return {int(game_id.decode('utf-8')) for game_id in game_ids}
\ No newline at end of file
+
+def cache_position_games(hash_game_pairs):
+    # Bez TTL-a: ključ koji istekne i ponovno nastane iz sljedećeg chunka imao bi samo nove partije, a SCARD bi vraćao premali broj
+    game_ids_by_key = defaultdict(set)
+    for position_hash, game_id in hash_game_pairs:
+        game_ids_by_key[position_key(position_hash)].add(game_id)
+
+    if not game_ids_by_key:
+        return
+
+    pipe = redis_client.pipeline(transaction=False)
+    for redis_key, game_ids in game_ids_by_key.items():
+        pipe.sadd(redis_key, *game_ids)
+        pipe.unlink(f"{redis_key}:none")
+    pipe.execute()
+
+
+def position_game_count(position_hash):
+    # Broj partija iz Redis skupa; kod promašaja se indeks puni u pozadini, a pozivatelj broji u bazi
+    count = redis_client.scard(position_key(position_hash))
+    if count:
+        return count
+
+    if redis_client.exists(position_empty_key(position_hash)):
+        return 0
+
+    if redis_client.set(position_warming_key(position_hash), 1, nx=True, ex=settings.POSITION_INDEX_LOCK_TIMEOUT):
+        from main.tasks import warm_position_index
+
+        warm_position_index.delay(position_hash)
+    return None
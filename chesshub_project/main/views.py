@@ -1,28 +1,31 @@
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.cache import cache
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.core.files.storage import default_storage
 from django.db.models import Q
+from django.utils import timezone
 
 from celery.result import AsyncResult
 
 import chess
 import chess.pgn
-import io
 import json
 from chess.pgn import read_game
 from io import StringIO
 
-from main.models import Game, FENPosition
-from main.chess_model.evaluation import evaluate_fen
-from .tasks import upload_pgn_to_storage
-from .utils import get_games_by_fen
+from main.models import Game, FENPosition, GameAnalysis, Position, PositionOccurrence, PositionMoveStats
+from main.chess_model.service import evaluate_position
+from main.chess_model.eval_cache import get_eval_cache, model_version
+from .tasks import analyse_game, upload_pgn_to_storage
+from .utils import position_game_count
+from .game_queries import apply_game_filters, approximate_game_count, bounded_count, game_facets, paginate_games
+from .game_cache import cached_count, cached_list
+from .analysis_tree import clear_tree, load_tree, save_tree
+from .pgn_utils import fen_hash
 
 board = chess.Board()
 
@@ -31,9 +34,7 @@ current_node = game
 
 @login_required(login_url='login/')
 def homepage(request):
-    current_fen = request.session.get('current_fen', chess.STARTING_FEN)
-    pgn_moves = request.session.get('pgn_moves', '')
-    current_index = request.session.get('current_index', 0)
+    tree = load_tree(request)
 
     filters = request.session.get('filters', {
         'sort_by_date': '-date',
@@ -47,13 +48,12 @@ def homepage(request):
     })
 
     filters = {key: value if value is not None else '' for key, value in filters.items()}
-    cleaned_pgn_moves = extract_pgn_moves(pgn_moves) if pgn_moves else ''
     
     return render(request, 'homepage.html', {
         'filters': json.dumps(filters),
-        'current_fen': current_fen,
-        'pgn_moves': cleaned_pgn_moves,
-        'current_index': current_index
+        'current_fen': tree.fen[tree.current],
+        'pgn_moves': tree.movetext() if tree.children[0] else '',
+        'current_index': tree.ply[tree.current]
     })
 
 @csrf_exempt
@@ -63,120 +63,53 @@ def add_move(request):
         move_san = data.get("move")
 
         try:
-            game = get_game_from_session(request)
-            current_index = request.session.get('current_index', 0)
-
-            current_node = game
-            for _ in range(current_index):
-                if current_node.variations:
-                    current_node = current_node.variations[0]
-
-            board = current_node.board()
+            tree = load_tree(request)
 
             try:
-                move = board.parse_san(move_san)
+                node, structure_changed = tree.add_move(move_san)
+            except chess.IllegalMoveError:
+                return JsonResponse({"error": "Illegal move"}, status=400)
             except ValueError:
                 return JsonResponse({"error": "Invalid move format"}, status=400)
 
-            if move not in board.legal_moves:
-                return JsonResponse({"error": "Illegal move"}, status=400)
-
-            existing_move = None
-            for variation in current_node.variations:
-                if variation.move == move:
-                    existing_move = variation
-                    break
-
-            if existing_move:
-                current_node = existing_move
-            else:
-                new_variation = current_node.add_variation(move)
-
-                if len(current_node.variations) > 1:
-                    try:
-                        move_to_promote = new_variation.move
-                        current_node.promote(move_to_promote)
-                    except Exception as e:
-                        return JsonResponse({"error": f"Promotion failed: {str(e)}"}, status=500)
-
-                current_node = new_variation
-
-            board.push(move)
-            fen = board.fen()
-
-            request.session['current_index'] = current_index + 1
-            request.session['current_fen'] = fen
-            request.session['pgn_moves'] = str(game)
-            request.session.modified = True
+            save_tree(request, tree, structure_changed)
 
-            return JsonResponse({
-                "fen": fen,
-                "pgn": extract_pgn_moves(str(game)),
+            response = {
+                "fen": tree.fen[node],
+                "delta": tree.delta(node),
                 "game_ids": []
-            })
+            }
+            # Tekst poteza se šalje samo kad se stablo promijenilo
+            if structure_changed:
+                response["pgn"] = tree.movetext()
+            return JsonResponse(response)
 
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
 
 @csrf_exempt
 def prev_move(request):
-    game = get_game_from_session(request)
-    current_index = request.session.get('current_index', 0)
-
-    if current_index > 0:
-        current_index -= 1
-        current_node = game
-        for _ in range(current_index):
-            current_node = current_node.variations[0]
-
-        board = current_node.board()
-        fen = board.fen()
+    tree = load_tree(request)
 
-        request.session['current_index'] = current_index
-        request.session['current_fen'] = fen
-        request.session['pgn_moves'] = str(game)
-        request.session.modified = True
-
-        return JsonResponse({"fen": fen, "pgn": str(game)})
+    if tree.back() is not None:
+        save_tree(request, tree)
+        return JsonResponse({"fen": tree.fen[tree.current], "delta": tree.delta()})
     else:
         return JsonResponse({"error": "No previous move available"}, status=400)
 
-def get_game_from_session(request):
-    pgn_moves = request.session.get('pgn_moves', '')
-    game = chess.pgn.Game()
-    if pgn_moves:
-        pgn_stream = io.StringIO(pgn_moves)
-        game = chess.pgn.read_game(pgn_stream)
-    return game
-
 @csrf_exempt
 def next_move(request):
-    game = get_game_from_session(request)
-    current_index = request.session.get('current_index', 0)
-
-    current_node = game
-    for _ in range(current_index):
-        if current_node.variations:
-            current_node = current_node.variations[0]
-
-    if current_node.variations:
-        if len(current_node.variations) == 1:
-            move = current_node.variations[0].move
-            board = current_node.board()
-            board.push(move)
-            current_node = current_node.variations[0]
-            current_index += 1
+    tree = load_tree(request)
+    children = tree.children[tree.current]
 
-            fen = board.fen()
+    if children:
+        if len(children) == 1:
+            tree.forward()
+            save_tree(request, tree)
 
-            request.session['current_index'] = current_index
-            request.session['current_fen'] = fen
-            request.session['pgn_moves'] = str(game)
-            request.session.modified = True
-
-            return JsonResponse({"fen": fen, "pgn": extract_pgn_moves(str(game))})
+            return JsonResponse({"fen": tree.fen[tree.current], "delta": tree.delta()})
         else:
-            variations = [str(variation.move) for variation in current_node.variations]
+            variations = [tree.uci[child] for child in children]
             return JsonResponse({"variations": variations})
     else:
         return JsonResponse({"error": "No next move available"}, status=400)
@@ -188,31 +121,17 @@ def choose_variation(request):
             data = json.loads(request.body)
             variation_index = int(data.get("variation_index", 0))
 
-            game = get_game_from_session(request)
-            current_index = request.session.get('current_index', 0)
-
-            current_node = game
-            for _ in range(current_index):
-                if current_node.variations:
-                    current_node = current_node.variations[0]
-
-            if 0 <= variation_index < len(current_node.variations):
-                chosen_variation = current_node.variations[variation_index]
-
-                move_san = chosen_variation.san()
-                board = current_node.board()
-                move_uci = board.parse_san(move_san)
-
-                current_node.promote(move_uci)
+            tree = load_tree(request)
+            node = tree.forward(variation_index)
 
-                request.session['pgn_moves'] = str(game)
-                request.session['current_fen'] = chosen_variation.board().fen()
-                request.session['current_index'] += 1
-                request.session.modified = True
+            if node is not None:
+                tree.promote(node)
+                save_tree(request, tree, structure_changed=variation_index > 0)
 
                 return JsonResponse({
-                    "fen": chosen_variation.board().fen(),
-                    "pgn": extract_pgn_moves(str(game))
+                    "fen": tree.fen[node],
+                    "delta": tree.delta(node),
+                    "pgn": tree.movetext()
                 })
             else:
                 return JsonResponse({"error": "Invalid variation index"}, status=400)
@@ -222,71 +141,31 @@ def choose_variation(request):
 
 @csrf_exempt
 def current_state(request):
-    fen = request.session.get('current_fen', chess.STARTING_FEN)
-    pgn_moves = request.session.get('pgn_moves', '')
-    current_index = request.session.get('current_index', 0)
-
-    game = get_game_from_session(request)
-
-    current_node = game
-    for _ in range(current_index):
-        if current_node.variations:
-            current_node = current_node.variations[0]
-
-    is_at_start = (current_index == 0)
-    has_next_move = bool(current_node.variations)
+    tree = load_tree(request)
 
     return JsonResponse({
-        "is_at_start": is_at_start,
-        "has_next_move": has_next_move,
-        "fen": fen
+        "is_at_start": tree.current == 0,
+        "has_next_move": bool(tree.children[tree.current]),
+        "fen": tree.fen[tree.current]
     })
 
 
 @csrf_exempt
 def reset_game(request):
-    request.session['current_index'] = 0
-    request.session['current_fen'] = chess.STARTING_FEN
-    request.session['pgn_moves'] = ''
-    request.session.modified = True
+    clear_tree(request)
 
     return JsonResponse({"success": True, "message": "Game reset successfully."})
             
 def get_games(request):
-    page = int(request.GET.get('page', 1))
-    page_size = 100
-
-    total_pages_key = 'games_total_pages'
-    total_games = Game.objects.count()
-
-    total_pages = (total_games // page_size) + (1 if total_games % page_size else 0)
-    cache.set(total_pages_key, total_pages, 1200)
-    print(f"[CACHE UPDATE] Total pages updated to {total_pages}")
-
-    cache_key = f'games_page_{page}'
-    cached_data = cache.get(cache_key)
-
-    if page == 1 or not cached_data:
-        print(f"[CACHE MISS] Fetching data from database for page {page}")
-        games = Game.objects.all().order_by('id')
-        paginator = Paginator(games, page_size)
-        page_obj = paginator.get_page(page)
-
-        games_list = list(page_obj.object_list.values(
-            'id', 'white_player', 'white_elo', 'black_player', 'black_elo', 'result', 'date', 'site'
+    # Kursor (keyset po id) ima isto trajanje za svaku stranicu; broj stranice ostaje za stare klijente
+    try:
+        response_data = cached_list('all', request.GET, lambda: paginate_games(
+            request.GET, Game.objects.all(), 'id', total_count=approximate_game_count()
         ))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-        response_data = {
-            'games': games_list,
-            'total_pages': total_pages,
-            'current_page': page
-        }
-
-        cache.set(cache_key, response_data, 1200)
-        return JsonResponse(response_data)
-
-    print(f"[CACHE HIT] Returning cached data for page {page}")
-    return JsonResponse(cached_data)
+    return JsonResponse(response_data)
 
 def game_details(request, game_id):
     game = get_object_or_404(Game, id=game_id)
@@ -346,59 +225,48 @@ def check_task_status(request, task_id):
     }
     return JsonResponse(response_data)
 
-def refresh_game_cache():
-    total_games = Game.objects.count()
-    total_pages = (total_games // 100) + (1 if total_games % 100 else 0)
-    cache.set('games_total_pages', total_pages, 1200)
-
 def filtered_games(request):
-    games = Game.objects.all()
-
-    filters = request.GET.dict()
+    filters = {k: v for k, v in request.GET.dict().items() if k not in ('page', 'cursor')}
     if not filters and 'filters' in request.session:
         filters = request.session.get('filters')
 
     filters = {k: v if v is not None else '' for k, v in filters.items()}
 
-    request.session['filters'] = filters
-    request.session.modified = True
+    # Sesija se zapisuje samo kad se filteri promijene
+    if request.session.get('filters') != filters:
+        request.session['filters'] = filters
 
-    if filters.get('date_from') and filters.get('date_to'):
-        games = games.filter(date__range=[filters['date_from'], filters['date_to']])
+    games = apply_game_filters(Game.objects.all(), filters)
 
-    if filters.get('white_elo_filter') and filters.get('white_elo'):
-        if filters['white_elo_filter'] == "exact":
-            games = games.filter(white_elo=filters['white_elo'])
-        elif filters['white_elo_filter'] == "gte":
-            games = games.filter(white_elo__gte=filters['white_elo'])
-        elif filters['white_elo_filter'] == "lte":
-            games = games.filter(white_elo__lte=filters['white_elo'])
-
-    if filters.get('black_elo_filter') and filters.get('black_elo'):
-        if filters['black_elo_filter'] == "exact":
-            games = games.filter(black_elo=filters['black_elo'])
-        elif filters['black_elo_filter'] == "gte":
-            games = games.filter(black_elo__gte=filters['black_elo'])
-        elif filters['black_elo_filter'] == "lte":
-            games = games.filter(black_elo__lte=filters['black_elo'])
+    has_filters = any(value for key, value in filters.items() if key != 'sort_by_date')
+    params = {**filters, 'page': request.GET.get('page'), 'cursor': request.GET.get('cursor')}
+    if has_filters:
+        total_count = cached_count('filtered', params, lambda: bounded_count(games))
+    else:
+        total_count = approximate_game_count()
 
-    if filters.get('result'):
-        games = games.filter(result=filters['result'])
+    try:
+        response_data = cached_list('filtered', params, lambda: paginate_games(
+            params, games, filters.get('sort_by_date') or '-date', total_count=total_count
+        ))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-    sort_by_date = filters.get('sort_by_date', '-date')
-    games = games.order_by(sort_by_date)
+    return JsonResponse(response_data)
 
-    page_number = request.GET.get('page', 1)
-    paginator = Paginator(games, 100)
-    page_obj = paginator.get_page(page_number)
+def game_facets_view(request):
+    filters = {k: v for k, v in request.GET.dict().items() if k not in ('page', 'cursor')}
+    if not filters and 'filters' in request.session:
+        filters = request.session.get('filters')
 
-    games_list = list(page_obj.object_list.values('white_player', 'white_elo', 'black_player', 'black_elo', 'result', 'date', 'site'))
+    filters = {k: v if v is not None else '' for k, v in filters.items()}
+    has_filters = any(value for key, value in filters.items() if key != 'sort_by_date')
 
-    return JsonResponse({
-        'games': games_list,
-        'total_pages': paginator.num_pages,
-        'current_page': page_obj.number
-    })
+    # Bez filtera se čita sažetak koji održava unos partija; inače keširani GROUP BY nad filtriranim upitom
+    games = apply_game_filters(Game.objects.all(), filters)
+    facet_filters = {k: v for k, v in filters.items() if k != 'sort_by_date'}
+    facets = cached_list('facets', facet_filters, lambda: game_facets(games, has_filters))
+    return JsonResponse({'facets': facets})
 
 @csrf_exempt
 def clear_filters(request):
@@ -406,26 +274,13 @@ def clear_filters(request):
         del request.session['filters']
     return JsonResponse({'status': 'success'})
 
-def extract_pgn_moves(pgn_string):
-    moves = []
-    lines = pgn_string.split("\n")
-    for line in lines:
-        if not line.startswith("["):
-            moves.append(line.strip())
-    return " ".join(moves).strip()
-
-
 import logging
 
 logger = logging.getLogger(__name__)
 
-import redis
 from django.conf import settings
 
-redis_client = redis.Redis.from_url(settings.REDIS_URL)
-
 def get_games_by_fen(request):
-    from main.helper import sanitize_fen
     fen = request.GET.get('fen', None)
     page = request.GET.get('page', 1)
 
@@ -450,64 +305,97 @@ def get_games_by_fen(request):
 
     filters = {k: v if v is not None else '' for k, v in filters.items()}
 
-    request.session['filters'] = filters
-    request.session.modified = True
-
-    sanitized_fen = sanitize_fen(fen)
-    redis_key = f"fen:{sanitized_fen}"
-    game_ids = redis_client.smembers(redis_key)
-
-    if not game_ids:
-        return JsonResponse({"games": [], "total_pages": 0, "current_page": page})
+    # Sesija se zapisuje samo kad se filteri promijene
+    if request.session.get('filters') != filters:
+        request.session['filters'] = filters
 
-    game_ids = [int(game_id.decode('utf-8')) for game_id in game_ids]
+    try:
+        position_hash = fen_hash(fen)
+    except ValueError:
+        return JsonResponse({"error": "Invalid FEN position"}, status=400)
+
+    # Spajanje s tablicom pojava radi baza (semi-join), umjesto ogromne id__in liste iz Redisa.
+    # Za popularne pozicije planer čita game_date_id_* indeks redom i za svaku partiju provjerava (position, game)
+    # indeks pojava, pa stranica staje nakon PAGE_SIZE redova bez sortiranja; rijetke pozicije skupe id-eve i sortiraju malo redova.
+    games_query = Game.objects.filter(
+        id__in=PositionOccurrence.objects.filter(position_id=position_hash).values('game_id')
+    )
+    games_query = apply_game_filters(games_query, filters)
+
+    has_filters = any(value for key, value in filters.items() if key != 'sort_by_date')
+    params = {**filters, 'page': request.GET.get('page'), 'cursor': request.GET.get('cursor')}
+    if has_filters:
+        total_count = cached_count('fen', params, lambda: bounded_count(games_query), extra={'position': position_hash})
+    else:
+        total_count = position_game_count(position_hash)
 
-    games_query = Game.objects.filter(id__in=game_ids)
+    try:
+        response_data = cached_list('fen', params, lambda: paginate_games(
+            params, games_query, filters['sort_by_date'], total_count=total_count
+        ), extra={'position': position_hash})
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-    if filters.get('date_from') and filters.get('date_to'):
-        games_query = games_query.filter(date__range=[filters['date_from'], filters['date_to']])
+    return JsonResponse(response_data)
 
-    if filters.get('white_elo_filter') and filters.get('white_elo'):
-        if filters['white_elo_filter'] == "exact":
-            games_query = games_query.filter(white_elo=filters['white_elo'])
-        elif filters['white_elo_filter'] == "gte":
-            games_query = games_query.filter(white_elo__gte=filters['white_elo'])
-        elif filters['white_elo_filter'] == "lte":
-            games_query = games_query.filter(white_elo__lte=filters['white_elo'])
 
-    if filters.get('black_elo_filter') and filters.get('black_elo'):
-        if filters['black_elo_filter'] == "exact":
-            games_query = games_query.filter(black_elo=filters['black_elo'])
-        elif filters['black_elo_filter'] == "gte":
-            games_query = games_query.filter(black_elo__gte=filters['black_elo'])
-        elif filters['black_elo_filter'] == "lte":
-            games_query = games_query.filter(black_elo__lte=filters['black_elo'])
+def percentage(part, total):
+    return round(part * 100 / total, 1) if total else 0.0
 
-    if filters.get('result'):
-        games_query = games_query.filter(result__iexact=filters['result'])
 
-    sort_by_date = filters.get('sort_by_date', '-date')
-    games_query = games_query.order_by(sort_by_date)
+def opening_explorer(request):
+    fen = request.GET.get('fen')
+    if not fen:
+        return JsonResponse({"error": "FEN position is required"}, status=400)
 
-    paginator = Paginator(games_query, 100)
-    page_obj = paginator.get_page(page)
+    try:
+        board = chess.Board(fen)
+    except ValueError:
+        return JsonResponse({"error": "Invalid FEN position"}, status=400)
 
-    games_list = list(page_obj.object_list.values(
-        'id', 'white_player', 'white_elo', 'black_player', 'black_elo', 'result', 'date', 'site'
-    ))
+    # Jedan indeksirani upit nad agregatom, bez skeniranja partija
+    position_id = fen_hash(fen)
+    stats = list(PositionMoveStats.objects.filter(position_id=position_id).order_by('-games', 'move'))
 
-    response_data = {
-        'games': games_list,
-        'total_pages': paginator.num_pages,
-        'current_page': page
+    # Evaluacije iz annotate_positions: pozicija i sve pozicije nakon ponuđenih poteza u jednom upitu
+    child_ids = {}
+    for row in stats:
+        move = chess.Move.from_uci(row.move)
+        if board.is_legal(move):
+            board.push(move)
+            child_ids[row.move] = fen_hash(board.fen())
+            board.pop()
+    annotations = {
+        row[0]: row[1:]
+        for row in Position.objects
+        .filter(id__in=[position_id, *child_ids.values()], eval__isnull=False)
+        .values_list('id', 'eval', 'best_move')
     }
+    no_annotation = (None, None)
 
-    return JsonResponse(response_data)
+    moves = []
+    for row in stats:
+        move = chess.Move.from_uci(row.move)
+        moves.append({
+            'uci': row.move,
+            'san': board.san(move) if board.is_legal(move) else row.move,
+            'eval': annotations.get(child_ids.get(row.move), no_annotation)[0],
+            'games': row.games,
+            'white': percentage(row.white_wins, row.games),
+            'draws': percentage(row.draws, row.games),
+            'black': percentage(row.black_wins, row.games),
+            'average_elo': row.elo_sum // row.elo_games if row.elo_games else None,
+            'last_played': row.last_played,
+        })
 
+    return JsonResponse({
+        'fen': board.fen(),
+        'total_games': sum(move['games'] for move in moves),
+        'eval': annotations.get(position_id, no_annotation)[0],
+        'best_move': annotations.get(position_id, no_annotation)[1],
+        'moves': moves,
+    })
 
-def generate_cache_key(fen, page, filters):
-    filter_str = '_'.join(f'{key}:{value}' for key, value in filters.items() if value)
-    return f"fen:{fen}:page:{page}:{filter_str}"
 
 @csrf_exempt
 def evaluate_fen_view(request):
@@ -515,8 +403,6 @@ def evaluate_fen_view(request):
         return JsonResponse({"error": "Only POST allowed"}, status=405)
 
     try:
-        from main.chess_model.evaluation import evaluate_fen, game_history
-
         data = json.loads(request.body)
         fen = data.get("fen")
         history = data.get("history", []) 
@@ -524,13 +410,13 @@ def evaluate_fen_view(request):
         if not fen:
             return JsonResponse({"error": "FEN is required"}, status=400)
 
-        game_history.clear()
-        game_history.extend(history)
+        logger.debug(f"Evaluating {fen} with {len(history)} history positions")
 
-        print("🧠 Evaluating FEN with history (length):", len(game_history))
-        print("📥 FEN:", fen)
+        try:
+            result = evaluate_position(fen, history, timeout=settings.EVAL_TIMEOUT)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
 
-        result = evaluate_fen(fen)
         board = chess.Board(fen)
 
         best_move = None
@@ -550,5 +436,46 @@ def evaluate_fen_view(request):
         })
 
     except Exception as e:
-        print("❌ Exception in evaluation:", str(e))
+        logger.error(f"Exception in evaluation: {e}")
         return JsonResponse({"error": str(e)}, status=500)
+
+
+def eval_cache_stats(request):
+    return JsonResponse(get_eval_cache().summary())
+
+
+def analysis_payload(analysis):
+    return {
+        "game_id": analysis.game_id,
+        "status": analysis.status,
+        "model_version": analysis.model_version,
+        "evals": analysis.evals,
+        "best_moves": analysis.best_moves,
+        "error": analysis.error,
+    }
+
+
+@csrf_exempt
+def analyse_game_view(request, game_id):
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request"}, status=405)
+
+    get_object_or_404(Game, id=game_id)
+    analysis, created = GameAnalysis.objects.get_or_create(game_id=game_id)
+
+    # Gotova analiza s trenutnim modelom se vraća odmah; partija koja je već u redu se ne šalje ponovno,
+    # osim ako se predugo nije promijenila (izgubljen task ili pad workera)
+    if analysis.status == "done" and analysis.model_version == model_version():
+        return JsonResponse(analysis_payload(analysis))
+    stale = analysis.updated_at < timezone.now() - timedelta(seconds=settings.ANALYSIS_STALE_AFTER)
+    if created or stale or analysis.status in ("done", "failed"):
+        analysis.status = "pending"
+        analysis.save(update_fields=["status", "updated_at"])
+        analyse_game.delay(game_id)
+
+    return JsonResponse(analysis_payload(analysis), status=202)
+
+
+def game_analysis(request, game_id):
+    analysis = get_object_or_404(GameAnalysis, game_id=game_id)
+    return JsonResponse(analysis_payload(analysis))